@@ -0,0 +1,58 @@
+"""
+Compare building the graphs of several large synthetic landscapes one after the
+other with building them in parallel worker processes.
+
+    python -m benchmarks.builds --landscapes 4 --processes 4
+"""
+
+import argparse
+import os
+import time
+
+import graph_router
+from benchmarks.synthetic import generate_synthetic_landscape
+
+
+def _build(landscape_jsons: dict[str, dict], processes: int) -> float:
+    graph_router.landscape_build_processes = processes
+    start = time.perf_counter()
+    graph_router._build_landscapes(landscape_jsons)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--landscapes", type=int, default=4)
+    parser.add_argument("--entities", type=int, default=25)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--idtypes", type=int, default=25)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    landscape_jsons = {
+        f"synthetic_{i}": generate_synthetic_landscape(
+            seed=args.seed + i,
+            prefix=f"synthetic_{i}",
+            entities=args.entities,
+            columns=args.columns,
+            idtypes=args.idtypes,
+        )
+        for i in range(args.landscapes)
+    }
+
+    # the workers are started once, before the builds are timed
+    _build(landscape_jsons, args.processes)
+    sequential = min(_build(landscape_jsons, 0) for _ in range(args.repeat))
+    parallel = min(_build(landscape_jsons, args.processes) for _ in range(args.repeat))
+    print(f"{args.landscapes} landscapes, {os.cpu_count()} CPUs")
+    print(f"{'sequential':<24}{sequential * 1000:>10.1f} ms")
+    print(
+        f"{f'{args.processes} processes':<24}{parallel * 1000:>10.1f} ms"
+        f"{sequential / parallel:>8.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
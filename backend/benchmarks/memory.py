@@ -0,0 +1,80 @@
+"""
+Compare the memory of the graphs stored as LandscapeGraph and as
+CompactLandscapeGraph on large synthetic landscapes.
+
+    python -m benchmarks.memory --landscapes 2 --entities 25
+"""
+
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.synthetic import generate_synthetic_landscape
+from graph import add_landscape_to_graph, build_landscape_graph
+from landscape_graph import CompactLandscapeGraph, LandscapeGraph, to_compact_graph
+
+
+def _load_landscapes(landscape_jsons: list[str], compact: bool) -> tuple:
+    # the landscapes are kept like the router keeps them: payload, landscape graph
+    # and the global graph
+    G = CompactLandscapeGraph() if compact else LandscapeGraph()
+    payloads, landscape_graphs = [], []
+    for i, landscape_json in enumerate(landscape_jsons):
+        payload = json.loads(landscape_json)
+        landscape_graph = build_landscape_graph(payload, f"synthetic_{i}")
+        if compact:
+            landscape_graph = to_compact_graph(landscape_graph)
+        add_landscape_to_graph(G, landscape_graph)
+        payloads.append(payload)
+        landscape_graphs.append(landscape_graph)
+    return G, payloads, landscape_graphs
+
+
+def _measure(landscape_jsons: list[str], compact: bool) -> tuple[int, int, int]:
+    gc.collect()
+    tracemalloc.start()
+    # everything loaded stays referenced until it is measured
+    loaded = _load_landscapes(landscape_jsons, compact)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    G = loaded[0]
+    return G.number_of_nodes(), G.number_of_edges(), size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--landscapes", type=int, default=2)
+    parser.add_argument("--entities", type=int, default=25)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--idtypes", type=int, default=25)
+    args = parser.parse_args()
+
+    # the landscapes share their idtypes, like landscapes of the same organization
+    landscape_jsons = [
+        json.dumps(
+            generate_synthetic_landscape(
+                seed=args.seed + i,
+                prefix=f"synthetic_{i}",
+                entities=args.entities,
+                columns=args.columns,
+                idtypes=args.idtypes,
+            )
+        )
+        for i in range(args.landscapes)
+    ]
+
+    nodes, edges, plain_size = _measure(landscape_jsons, compact=False)
+    _, _, compact_size = _measure(landscape_jsons, compact=True)
+    print(f"{args.landscapes} landscapes, {nodes} nodes, {edges} relations")
+    print(f"{'LandscapeGraph':<24}{plain_size / 2**20:>10.1f} MiB")
+    print(
+        f"{'CompactLandscapeGraph':<24}{compact_size / 2**20:>10.1f} MiB"
+        f"{compact_size / plain_size:>8.0%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
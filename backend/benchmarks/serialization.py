@@ -0,0 +1,78 @@
+"""
+Compare serializing the node-link data of a large synthetic graph through
+jsonable_encoder, like FastAPI does, with get_json_bytes.
+
+    python -m benchmarks.serialization --landscapes 2 --entities 25
+"""
+
+import argparse
+import timeit
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+import graph
+from benchmarks.synthetic import generate_synthetic_landscape
+from graph import (
+    add_landscape_to_graph,
+    build_landscape_graph,
+    get_json_bytes,
+    get_node_link_data,
+)
+from landscape_graph import LandscapeGraph
+
+
+def _get_stdlib_json_bytes(data) -> bytes:
+    orjson, graph.orjson = graph.orjson, None
+    try:
+        return get_json_bytes(data)
+    finally:
+        graph.orjson = orjson
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--landscapes", type=int, default=2)
+    parser.add_argument("--entities", type=int, default=25)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--idtypes", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    G = LandscapeGraph()
+    for i in range(args.landscapes):
+        landscape = generate_synthetic_landscape(
+            seed=args.seed + i,
+            prefix=f"synthetic_{i}",
+            entities=args.entities,
+            columns=args.columns,
+            idtypes=args.idtypes,
+        )
+        add_landscape_to_graph(G, build_landscape_graph(landscape, f"synthetic_{i}"))
+    data = get_node_link_data(G)
+
+    serializers = {
+        "jsonable_encoder": lambda: JSONResponse(jsonable_encoder(data)).body,
+        "get_json_bytes (json)": lambda: _get_stdlib_json_bytes(data),
+    }
+    if graph.orjson is not None:
+        serializers["get_json_bytes (orjson)"] = lambda: get_json_bytes(data)
+
+    # the responses have to stay byte-compatible with the current ones
+    expected = serializers["jsonable_encoder"]()
+    for name, serialize in serializers.items():
+        if serialize() != expected:
+            raise AssertionError(f"{name} differs from the jsonable_encoder response")
+
+    print(f"{G.number_of_nodes()} nodes, {G.number_of_edges()} relations")
+    print(f"{len(expected) / 2**20:.1f} MiB of JSON")
+    baseline = None
+    for name, serialize in serializers.items():
+        seconds = min(timeit.repeat(serialize, number=1, repeat=args.repeat))
+        baseline = baseline or seconds
+        print(f"{name:<26}{seconds * 1000:>10.1f} ms{baseline / seconds:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Time and measure the peak memory of each stage of the landscape pipeline on
+synthetic landscapes of increasing size.
+
+    python -m benchmarks.stages --tiers small,medium,large --record stages.json
+    python -m benchmarks.stages --baseline stages.json
+"""
+
+import argparse
+import copy
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+
+import networkx as nx
+
+import graph
+from benchmarks.synthetic import generate_synthetic_landscape
+from graph import (
+    add_landscape_to_graph,
+    build_landscape_graph,
+    deduplicate_relations,
+    get_flattened_landscape,
+    get_json_bytes,
+    get_node_link_data,
+    populate_graph,
+    populate_idtype_relations,
+    populate_one_to_n_relations,
+    populate_ordino_drilldown_relations,
+)
+from landscape_graph import LandscapeGraph
+from landscape_merge import merge_landscape_dict
+
+# the landscapes have 2 databases of 2 schemas, the entities and idtypes grow with
+# the tier, the fan-out of the idtypes stays the same
+_tiers = {
+    "small": {"entities": 8, "idtypes": 8, "relations": 16},
+    "medium": {"entities": 32, "idtypes": 32, "relations": 64},
+    "large": {"entities": 128, "idtypes": 128, "relations": 256},
+    "xlarge": {"entities": 512, "idtypes": 512, "relations": 1024},
+}
+
+
+def _merge_landscape_graphs(landscape_graphs: list[nx.MultiDiGraph]) -> LandscapeGraph:
+    G = LandscapeGraph()
+    for landscape_graph in landscape_graphs:
+        add_landscape_to_graph(G, landscape_graph)
+    return G
+
+
+def _get_stages(
+    landscapes: dict[str, dict], max_idtype_fanout: int | None
+) -> dict[str, tuple[Callable[[], tuple], Callable]]:
+    """
+    The stages as (setup, run) pairs, `run` is timed on the arguments returned by
+    `setup`. Each stage gets the output of the previous stages as its input.
+    """
+    items = list(landscapes.items())
+    nodes = [populate_graph(payload, name) for name, payload in items]
+    idtype_relations = [
+        populate_idtype_relations(G, name, max_idtype_fanout)
+        for G, (name, _) in zip(nodes, items)
+    ]
+    one_to_n_relations = [
+        populate_one_to_n_relations(G, payload, name)
+        for G, (name, payload) in zip(idtype_relations, items)
+    ]
+    landscape_graphs = [
+        build_landscape_graph(payload, name, max_idtype_fanout)
+        for name, payload in items
+    ]
+    G = _merge_landscape_graphs(landscape_graphs)
+    G_rest = nx.freeze(_merge_landscape_graphs(landscape_graphs[:-1]))
+    data = get_node_link_data(G)
+
+    return {
+        "populate_graph": (
+            lambda: (),
+            lambda: [populate_graph(payload, name) for name, payload in items],
+        ),
+        "populate_idtype_relations": (
+            lambda: (),
+            lambda: [
+                populate_idtype_relations(G, name, max_idtype_fanout)
+                for G, (name, _) in zip(nodes, items)
+            ],
+        ),
+        "populate_one_to_n_relations": (
+            lambda: (),
+            lambda: [
+                populate_one_to_n_relations(G, payload, name)
+                for G, (name, payload) in zip(idtype_relations, items)
+            ],
+        ),
+        "populate_ordino_drilldown_relations": (
+            lambda: (),
+            lambda: [
+                populate_ordino_drilldown_relations(G, payload, name)
+                for G, (name, payload) in zip(one_to_n_relations, items)
+            ],
+        ),
+        "build_landscape_graph": (
+            lambda: (),
+            lambda: [
+                build_landscape_graph(payload, name, max_idtype_fanout)
+                for name, payload in items
+            ],
+        ),
+        # graphs built by the pipeline are deduplicated on insert, the relations of
+        # a plain graph are deduplicated by scanning them
+        "deduplicate_relations": (
+            lambda: (nx.MultiDiGraph(G),),
+            deduplicate_relations,
+        ),
+        "add_landscape_to_graph": (
+            lambda: (),
+            lambda: _merge_landscape_graphs(landscape_graphs),
+        ),
+        # a writer of the router adds a landscape to a copy of the published graph,
+        # a full copy costs in proportion to the graph, a copy on write to the change
+        "add_landscape_to_copy": (
+            lambda: (),
+            lambda: add_landscape_to_graph(G_rest.copy(), landscape_graphs[-1]),
+        ),
+        "add_landscape_to_copy_on_write": (
+            lambda: (),
+            lambda: add_landscape_to_graph(
+                G_rest.copy_on_write(), landscape_graphs[-1]
+            ),
+        ),
+        "merge_landscape_dict": (
+            lambda: (
+                [
+                    {"name": name, "type": "file", "json_obj": copy.deepcopy(payload)}
+                    for name, payload in items
+                ],
+            ),
+            lambda landscapes: merge_landscape_dict(landscapes, log_level=None),
+        ),
+        "get_flattened_landscape": (lambda: (), lambda: get_flattened_landscape(G)),
+        "node_link_data": (lambda: (), lambda: get_node_link_data(G)),
+        "get_json_bytes": (lambda: (), lambda: get_json_bytes(data)),
+    }
+
+
+def _measure(setup: Callable[[], tuple], run: Callable, repeat: int) -> dict:
+    seconds = math.inf
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        run(*args)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    # memory is measured in a run of its own, tracing slows the timed runs down
+    args = setup()
+    tracemalloc.start()
+    run(*args)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak_bytes}
+
+
+def _run_tier(tier: dict, args: argparse.Namespace) -> dict:
+    landscapes = {
+        f"synthetic_{i}": generate_synthetic_landscape(
+            seed=args.seed + i,
+            prefix=f"synthetic_{i}",
+            entities=tier["entities"],
+            columns=args.columns,
+            idtypes=tier["idtypes"],
+            idtype_fanout=args.idtype_fanout,
+            # a third of the relations are ordino drilldowns
+            one_to_n_relations=tier["relations"] - tier["relations"] // 3,
+            drilldown_relations=tier["relations"] // 3,
+        )
+        for i in range(args.landscapes)
+    }
+    stages = _get_stages(landscapes, args.max_idtype_fanout)
+    G = _merge_landscape_graphs(
+        [
+            build_landscape_graph(payload, name, args.max_idtype_fanout)
+            for name, payload in landscapes.items()
+        ]
+    )
+    return {
+        "params": tier,
+        "nodes": G.number_of_nodes(),
+        "edges": G.number_of_edges(),
+        "stages": {
+            name: _measure(setup, run, args.repeat)
+            for name, (setup, run) in stages.items()
+        },
+    }
+
+
+def _get_exponent(report: dict, stage: str) -> float | None:
+    # slope of the time over the size of the graph between the smallest and the
+    # largest tier, on a log-log scale: 1 is linear, 2 quadratic
+    tiers = list(report["tiers"].values())
+    first, last = tiers[0], tiers[-1]
+    sizes = [tier["nodes"] + tier["edges"] for tier in (first, last)]
+    times = [tier["stages"][stage]["seconds"] for tier in (first, last)]
+    if len(tiers) < 2 or sizes[0] == sizes[1] or min(times) <= 0:
+        return None
+    return math.log(times[1] / times[0]) / math.log(sizes[1] / sizes[0])
+
+
+def _print_report(report: dict, baseline: dict | None, tolerance: float) -> list[str]:
+    tiers = report["tiers"]
+    print(f"{'':<38}" + "".join(f"{name:>12}" for name in tiers) + f"{'exponent':>10}")
+    print(
+        f"{'nodes + edges':<38}"
+        + "".join(f"{tier['nodes'] + tier['edges']:>12}" for tier in tiers.values())
+    )
+    regressions = []
+    stages = next(iter(tiers.values()))["stages"]
+    for unit, key, scale in [("ms", "seconds", 1000), ("MiB", "peak_bytes", 2**-20)]:
+        print(f"\n{key}")
+        for stage in stages:
+            line = f"{stage:<38}"
+            for tier_name, tier in tiers.items():
+                value = tier["stages"][stage][key]
+                line += f"{value * scale:>8.1f} {unit:<3}"
+                base = (baseline or {}).get("tiers", {}).get(tier_name, {})
+                base_value = base.get("stages", {}).get(stage, {}).get(key)
+                if key == "seconds" and base_value and value / base_value > tolerance:
+                    regressions.append(f"{stage} ({tier_name})")
+            if key == "seconds":
+                exponent = _get_exponent(report, stage)
+                line += f"{exponent:>10.2f}" if exponent is not None else ""
+            print(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tiers", default="small,medium,large")
+    parser.add_argument("--landscapes", type=int, default=2)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--idtype-fanout", type=int, default=16)
+    parser.add_argument("--max-idtype-fanout", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--record", help="write the report to this file")
+    parser.add_argument("--baseline", help="compare the times with this report")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "networkx": nx.__version__,
+        "orjson": graph.orjson is not None,
+        "args": {
+            name: value
+            for name, value in vars(args).items()
+            if name not in ("record", "baseline", "tolerance")
+        },
+        "tiers": {
+            name: _run_tier(_tiers[name], args) for name in args.tiers.split(",")
+        },
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = _print_report(report, baseline, args.tolerance)
+
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if regressions:
+        sys.exit(f"Slower than the baseline: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Measure how long a fresh server process takes to import the app and to be ready
+with preloaded landscapes, with and without their graphs cached on disk.
+
+    python -m benchmarks.startup --landscapes visyn_kb --record startup.json
+    python -m benchmarks.startup --landscapes visyn_kb --baseline startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# run in a new interpreter, the times are measured from before the app is imported
+_startup_script = """
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    while client.get("/health").status_code == 503:
+        time.sleep(0.001)
+    status = client.get("/health").json()["status"]
+print(json.dumps({
+    "import": imported - start, "ready": time.perf_counter() - start, "status": status
+}))
+"""
+
+
+def _start(landscapes: str, cache_dir: str) -> dict[str, float]:
+    env = {
+        **os.environ,
+        "PRELOAD_LANDSCAPES": landscapes,
+        "LANDSCAPE_GRAPH_CACHE_DIR": cache_dir,
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", _startup_script],
+        env=env,
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    times = json.loads(result.stdout.splitlines()[-1])
+    if times.pop("status") != "ready":
+        raise AssertionError(f"The landscapes {landscapes} failed to preload")
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--landscapes", default="visyn_kb")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--record", help="write the times to this file")
+    parser.add_argument("--baseline", help="compare the times with this file")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # the first start fills the cache of the later ones
+        _start(args.landscapes, cache_dir)
+        runs = {
+            "built": [_start(args.landscapes, "") for _ in range(args.repeat)],
+            "cached": [_start(args.landscapes, cache_dir) for _ in range(args.repeat)],
+        }
+    results = {
+        "import": min(run["import"] for run in runs["built"] + runs["cached"]),
+        "ready (built)": min(run["ready"] for run in runs["built"]),
+        "ready (cached)": min(run["ready"] for run in runs["cached"]),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = []
+    for name, seconds in results.items():
+        line = f"{name:<24}{seconds * 1000:>10.1f} ms"
+        if baseline and name in baseline:
+            ratio = seconds / baseline[name]
+            line += f"{ratio:>8.2f}x"
+            if ratio > args.tolerance:
+                regressions.append(name)
+        print(line)
+
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        sys.exit(f"Slower than the baseline: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
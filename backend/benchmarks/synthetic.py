@@ -0,0 +1,94 @@
+import random
+
+_column_types = ["string", "number", "categorical", "link"]
+
+
+def generate_synthetic_landscape(
+    seed: int = 0,
+    prefix: str = "synthetic",
+    databases: int = 2,
+    schemas: int = 2,
+    entities: int = 20,
+    columns: int = 12,
+    idtypes: int = 10,
+    one_to_n_relations: int = 34,
+    drilldown_relations: int = 16,
+    idtype_column_ratio: float = 0.25,
+    idtype_fanout: int | None = None,
+) -> dict:
+    """
+    Generate a landscape shaped like the landscapes in `data/`. The same arguments
+    always generate the same landscape.
+
+    `entities` are the entities of each schema and `columns` the columns of each
+    entity. Each idtype is used by the columns of at most `idtype_fanout` entities,
+    `None` lets any entity use any idtype.
+    """
+    rng = random.Random(seed)
+    idtype_ids = [f"IdType{i}" for i in range(idtypes)]
+    landscape = {
+        "idtypes": [
+            {"id": idtype_id, "label": f"{idtype_id} name", "icon": "dv-idtype"}
+            for idtype_id in idtype_ids
+        ],
+        "databases": [],
+        "relations": [],
+    }
+    idtype_entities = {idtype_id: set() for idtype_id in idtype_ids}
+
+    def get_idtype(entity_id: str) -> dict:
+        if not idtype_ids or rng.random() >= idtype_column_ratio:
+            return {}
+        idtype_id = rng.choice(idtype_ids)
+        entity_ids = idtype_entities[idtype_id]
+        if idtype_fanout is not None and len(entity_ids - {entity_id}) >= idtype_fanout:
+            return {}
+        entity_ids.add(entity_id)
+        return {"idtype": idtype_id}
+
+    entity_ids = []
+    for d in range(databases):
+        database = {"id": f"{prefix}_{d}", "dbEngine": "postgresql", "schemas": []}
+        for s in range(schemas):
+            schema = {"name": f"schema_{s}", "entities": []}
+            for e in range(entities):
+                table_name = f"table_{e}"
+                entity_id = f"{prefix}_{d}.schema_{s}.{table_name}"
+                schema["entities"].append(
+                    {
+                        "name": f"Table {d}.{s}.{e}",
+                        "tableName": table_name,
+                        "description": f"Synthetic table {e} of schema {s}.",
+                        "columns": [
+                            {
+                                "columnName": f"column_{c}",
+                                "label": f"Column {c}",
+                                "initialRanking": rng.random() < 0.5,
+                                "type": rng.choice(_column_types),
+                                **get_idtype(entity_id),
+                            }
+                            for c in range(columns)
+                        ],
+                    }
+                )
+                entity_ids.append(entity_id)
+            database["schemas"].append(schema)
+        landscape["databases"].append(database)
+
+    relation_types = ["1-n"] * one_to_n_relations
+    relation_types += ["ordino-drilldown"] * drilldown_relations
+    for relation_type in relation_types:
+        source, target = rng.sample(entity_ids, 2)
+        relation = {
+            "type": relation_type,
+            "source": {"id": source, "key": f"column_{rng.randrange(columns)}"},
+            "target": {"id": target, "key": f"column_{rng.randrange(columns)}"},
+            "bidirectional": rng.random() < 0.5,
+        }
+        if relation_type == "ordino-drilldown":
+            relation["mapping"] = [
+                {"entity": source, "sourceKey": "column_0", "targetKey": "column_1"}
+            ]
+        landscape["relations"].append(relation)
+
+    return landscape
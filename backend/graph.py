@@ -1,12 +1,31 @@
+import json
+from collections.abc import Collection, Mapping
+from functools import cache
+
 import networkx as nx
+from networkx.readwrite import json_graph
 
+from graph_metrics import instrument_stage
+from landscape_graph import (
+    LandscapeGraph,
+    expand_data,
+    get_derived_edges,
+    get_edges_of_type,
+    get_nodes_of_type,
+    get_relation_class,
+    get_uploaded_nodes,
+)
 from landscape_merge import get_relation_string
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def populate_idtype_nodes(
-    G_In: nx.MultiDiGraph, idtypes: list[dict], landscape_name: str
-) -> nx.MultiDiGraph:
-    G = G_In.copy()
+
+def _add_idtype_nodes(
+    G: nx.MultiDiGraph, idtypes: list[dict], landscape_name: str
+) -> None:
     for idtype in idtypes:
         G.add_node(
             idtype.get("id"),
@@ -25,13 +44,19 @@ def populate_idtype_nodes(
                 **idtype,
             },
         )
-    return G
 
 
-def populate_entity_nodes(
-    G_In: nx.MultiDiGraph, entities: list[dict], landscape_name: str
+def populate_idtype_nodes(
+    G_In: nx.MultiDiGraph, idtypes: list[dict], landscape_name: str
 ) -> nx.MultiDiGraph:
     G = G_In.copy()
+    _add_idtype_nodes(G, idtypes, landscape_name)
+    return G
+
+
+def _add_entity_nodes(
+    G: nx.MultiDiGraph, entities: list[dict], landscape_name: str
+) -> None:
     for entity in entities:
         G.add_node(
             entity.get("id"),
@@ -50,13 +75,17 @@ def populate_entity_nodes(
                 **entity,
             },
         )
-    return G
 
 
-def populate_idtype_mapping_relations(
-    G_In: nx.MultiDiGraph, landscape_name: str
+def populate_entity_nodes(
+    G_In: nx.MultiDiGraph, entities: list[dict], landscape_name: str
 ) -> nx.MultiDiGraph:
     G = G_In.copy()
+    _add_entity_nodes(G, entities, landscape_name)
+    return G
+
+
+def _add_idtype_mapping_relations(G: nx.MultiDiGraph, landscape_name: str) -> None:
     entities_in_graph_with_idtype_columns = [
         (
             n,
@@ -66,14 +95,9 @@ def populate_idtype_mapping_relations(
                 if col.get("idtype", None) is not None
             ],
         )
-        for n, attr in G_In.nodes(data=True)
-        if attr.get("data", {}).get("type") == "entity"
-    ]
-    idtypes_in_graph = [
-        n
-        for n, attr in G_In.nodes(data=True)
-        if attr.get("data", {}).get("type") == "idtype"
+        for n, attr in get_nodes_of_type(G, "entity")
     ]
+    idtypes_in_graph = {n for n, attr in get_nodes_of_type(G, "idtype")}
     for entity, columns in entities_in_graph_with_idtype_columns:
         for col in columns:
             idtype = col.get("idtype")
@@ -94,7 +118,7 @@ def populate_idtype_mapping_relations(
                         "origins": {
                             *(
                                 list(
-                                    G_In.edges.get(
+                                    G.edges.get(
                                         (
                                             entity,
                                             idtype,
@@ -110,135 +134,144 @@ def populate_idtype_mapping_relations(
                         },
                     },
                 )
-    return G
 
 
-def derive_one_to_one_relations_from_idtype(
-    G_In: nx.MultiDiGraph, idtype: dict, landscape_name: str
+def populate_idtype_mapping_relations(
+    G_In: nx.MultiDiGraph, landscape_name: str
 ) -> nx.MultiDiGraph:
     G = G_In.copy()
-    idtype_node_id = idtype.get("id")
-    connected_entities = [
-        predecessor
-        for predecessor in G.predecessors(idtype_node_id)
-        if G.nodes.get(predecessor, {}).get("data", {}).get("type") == "entity"
-    ]
-    for i in range(len(connected_entities)):
-        for j in range(i + 1, len(connected_entities)):
-            forward_relation = {
-                "type": "1-1",
-                "via_idtype": idtype_node_id,
-                "is_derived": True,
-                "source": {
-                    "entityId": connected_entities[i],
-                    "columns": [
-                        col
-                        for col in G.nodes.get(connected_entities[i], {})
-                        .get("data", {})
-                        .get("columns", [])
-                        if col.get("idtype") == idtype_node_id
-                    ],
-                },
-                "target": {
-                    "entityId": connected_entities[j],
-                    "columns": [
-                        col
-                        for col in G.nodes.get(connected_entities[j], {})
-                        .get("data", {})
-                        .get("columns", [])
-                        if col.get("idtype") == idtype_node_id
-                    ],
-                },
-            }
-            forward_relation_hash, _ = get_relation_string(forward_relation)
-            reverse_relation = {
-                "type": "1-1",
+    _add_idtype_mapping_relations(G, landscape_name)
+    return G
+
+
+def _get_idtype_columns_index(
+    G: nx.MultiDiGraph,
+) -> dict[tuple[str, str], list[dict]]:
+    columns_index: dict[tuple[str, str], list[dict]] = {}
+    for n, attr in get_nodes_of_type(G, "entity"):
+        for col in attr.get("data", {}).get("columns", []):
+            if col.get("idtype") is not None:
+                columns_index.setdefault((n, col.get("idtype")), []).append(col)
+    return columns_index
+
+
+def _get_one_to_one_relation(
+    source: str,
+    target: str,
+    idtype_node_id: str,
+    source_columns: list[dict],
+    target_columns: list[dict],
+) -> dict:
+    return {
+        "type": "1-1",
+        "via_idtype": idtype_node_id,
+        "is_derived": True,
+        "source": {"entityId": source, "columns": source_columns},
+        "target": {"entityId": target, "columns": target_columns},
+    }
+
+
+def _get_one_to_one_edge(
+    G: nx.MultiDiGraph,
+    source: str,
+    target: str,
+    idtype_node_id: str,
+    source_columns: list[dict],
+    target_columns: list[dict],
+    landscape_name: str,
+) -> tuple[str, str, str, dict]:
+    relation = _get_one_to_one_relation(
+        source, target, idtype_node_id, source_columns, target_columns
+    )
+    relation_hash, _ = get_relation_string(relation)
+    return (
+        source,
+        target,
+        relation_hash,
+        {
+            "data": {
                 "via_idtype": idtype_node_id,
-                "is_derived": True,
-                "source": {
-                    "entityId": connected_entities[j],
-                    "columns": [
-                        col
-                        for col in G.nodes.get(connected_entities[j], {})
-                        .get("data", {})
-                        .get("columns", [])
-                        if col.get("idtype") == idtype_node_id
-                    ],
-                },
-                "target": {
-                    "entityId": connected_entities[i],
-                    "columns": [
-                        col
-                        for col in G.nodes.get(connected_entities[i], {})
-                        .get("data", {})
-                        .get("columns", [])
-                        if col.get("idtype") == idtype_node_id
-                    ],
-                },
-            }
-            reverse_relation_hash, _ = get_relation_string(reverse_relation)
-            G.add_edge(
-                connected_entities[i],
-                connected_entities[j],
-                key=forward_relation_hash,
-                data={
-                    "via_idtype": idtype_node_id,
-                    "origins": {
-                        *(
-                            list(
-                                G.edges.get(
-                                    (
-                                        connected_entities[i],
-                                        connected_entities[j],
-                                        forward_relation_hash,  # For MultiDiGraph, need to specify the key
-                                    ),
-                                    {},
-                                )
-                                .get("data", {})
-                                .get("origins", [])
-                            )
-                            + [landscape_name]
-                        )
-                    },
-                    **forward_relation,
-                },
-            )
-            G.add_edge(
-                connected_entities[j],
-                connected_entities[i],
-                key=reverse_relation_hash,
-                data={
-                    "via_idtype": idtype_node_id,
-                    "origins": {
-                        *(
-                            list(
-                                G.edges.get(
-                                    (
-                                        connected_entities[j],
-                                        connected_entities[i],
-                                        reverse_relation_hash,  # For MultiDiGraph, need to specify the key
-                                    ),
-                                    {},
-                                )
-                                .get("data", {})
-                                .get("origins", [])
+                "origins": {
+                    *(
+                        list(
+                            G.edges.get(
+                                (
+                                    source,
+                                    target,
+                                    relation_hash,  # For MultiDiGraph, need to specify the key
+                                ),
+                                {},
                             )
-                            + [landscape_name]
+                            .get("data", {})
+                            .get("origins", [])
                         )
-                    },
-                    **reverse_relation,
+                        + [landscape_name]
+                    )
                 },
-            )
-    return G
+                **relation,
+            }
+        },
+    )
 
 
-def populate_graph(payload: dict, landscape_name: str) -> nx.MultiDiGraph:
-    G = nx.MultiDiGraph()
-    G = populate_idtype_nodes(
-        G, payload.get("idtypes", []), landscape_name=landscape_name
-    )
+def _get_connected_entities(G: nx.MultiDiGraph, idtype_node_id: str) -> list[str]:
+    return [
+        predecessor
+        for predecessor in G.predecessors(idtype_node_id)
+        if G.nodes.get(predecessor, {}).get("data", {}).get("type") == "entity"
+    ]
+
+
+def _derive_one_to_one_relations(
+    G: nx.MultiDiGraph, idtype_node_ids: list[str], landscape_name: str
+) -> None:
+    # Index the idtype columns of every entity once, then collect the 1-1 edges of
+    # all idtypes and insert them in a single batch.
+    columns_index = _get_idtype_columns_index(G)
+    edges = []
+    for idtype_node_id in idtype_node_ids:
+        connected_entities = _get_connected_entities(G, idtype_node_id)
+        connected_columns = [
+            columns_index.get((entity, idtype_node_id), [])
+            for entity in connected_entities
+        ]
+        for i in range(len(connected_entities)):
+            for j in range(i + 1, len(connected_entities)):
+                edges.append(
+                    _get_one_to_one_edge(
+                        G,
+                        connected_entities[i],
+                        connected_entities[j],
+                        idtype_node_id,
+                        connected_columns[i],
+                        connected_columns[j],
+                        landscape_name,
+                    )
+                )
+                edges.append(
+                    _get_one_to_one_edge(
+                        G,
+                        connected_entities[j],
+                        connected_entities[i],
+                        idtype_node_id,
+                        connected_columns[j],
+                        connected_columns[i],
+                        landscape_name,
+                    )
+                )
+    G.add_edges_from(edges)
 
-    entities = [
+
+def derive_one_to_one_relations_from_idtype(
+    G_In: nx.MultiDiGraph, idtype: dict, landscape_name: str
+) -> nx.MultiDiGraph:
+    G = G_In.copy()
+    _derive_one_to_one_relations(G, [idtype.get("id")], landscape_name)
+    return G
+
+
+def _get_entities(payload: dict) -> list[dict]:
+    return [
         {
             "id": f"{db.get('id')}.{schema.get('name')}.{entity.get('tableName')}"
             if schema.get("name") is not None
@@ -250,28 +283,184 @@ def populate_graph(payload: dict, landscape_name: str) -> nx.MultiDiGraph:
         for entity in schema.get("entities", [])
     ]
 
-    G = populate_entity_nodes(G, entities, landscape_name=landscape_name)
 
+@instrument_stage
+def populate_graph(payload: dict, landscape_name: str) -> nx.MultiDiGraph:
+    G = LandscapeGraph()
+    _add_idtype_nodes(G, payload.get("idtypes", []), landscape_name=landscape_name)
+    _add_entity_nodes(G, _get_entities(payload), landscape_name=landscape_name)
     return G
 
 
+def _add_idtype_relations(
+    G: nx.MultiDiGraph, landscape_name: str, max_idtype_fanout: int | None = None
+) -> None:
+    _add_idtype_mapping_relations(G, landscape_name)
+    idtype_node_ids = [n for n, attr in get_nodes_of_type(G, "idtype")]
+    if max_idtype_fanout is not None:
+        # idtypes connecting more entities than the threshold are kept as implicit
+        # hubs, their 1-1 relations are only synthesized on demand
+        implicit_idtype_node_ids = [
+            n
+            for n in idtype_node_ids
+            if len(_get_connected_entities(G, n)) > max_idtype_fanout
+        ]
+        implicit_idtypes = _get_implicit_idtypes(G)
+        for n in implicit_idtype_node_ids:
+            implicit_idtypes[n] = {*implicit_idtypes.get(n, set()), landscape_name}
+        if implicit_idtypes:
+            G.graph["implicit_idtypes"] = implicit_idtypes
+        idtype_node_ids = [
+            n for n in idtype_node_ids if n not in implicit_idtype_node_ids
+        ]
+    _derive_one_to_one_relations(G, idtype_node_ids, landscape_name)
+
+
+@instrument_stage
 def populate_idtype_relations(
-    G_In: nx.MultiDiGraph, landscape_name: str
+    G_In: nx.MultiDiGraph, landscape_name: str, max_idtype_fanout: int | None = None
 ) -> nx.MultiDiGraph:
     G = G_In.copy()
-    G = populate_idtype_mapping_relations(G, landscape_name)
-    for n, attr in G.nodes(data=True):
-        if attr.get("data", {}).get("type") == "idtype":
-            G = derive_one_to_one_relations_from_idtype(
-                G, attr.get("data", {}), landscape_name
-            )
+    _add_idtype_relations(G, landscape_name, max_idtype_fanout)
     return G
 
 
-def populate_one_to_n_relations(
-    G_In: nx.MultiDiGraph, payload: dict, landscape_name: str
-) -> nx.MultiDiGraph:
+def _get_implicit_idtypes(G: nx.MultiDiGraph) -> dict[str, set[str]]:
+    return {
+        idtype: set(landscapes)
+        for idtype, landscapes in G.graph.get("implicit_idtypes", {}).items()
+    }
+
+
+def _get_implicit_one_to_one_edges(
+    G: nx.MultiDiGraph, idtype_node_id: str, node_id: str | None = None
+) -> list[tuple[str, str, str, dict]]:
+    implicit_landscapes = G.graph.get("implicit_idtypes", {}).get(idtype_node_id)
+    if not implicit_landscapes or idtype_node_id not in G:
+        return []
+
+    # A pair of entities is only related in the landscapes that map both of them to
+    # the idtype and keep the idtype implicit
+    members = []
+    for entity in _get_connected_entities(G, idtype_node_id):
+        origins = {
+            origin
+            for attr in G[entity][idtype_node_id].values()
+            if attr.get("data", {}).get("type") == "idtype-mapping"
+            for origin in attr.get("data", {}).get("origins", [])
+            if origin in implicit_landscapes
+        }
+        if origins:
+            columns = [
+                col
+                for col in G.nodes[entity].get("data", {}).get("columns", [])
+                if col.get("idtype") == idtype_node_id
+            ]
+            members.append((entity, origins, columns))
+
+    if node_id is None:
+        pairs = [
+            (members[i], members[j])
+            for i in range(len(members))
+            for j in range(i + 1, len(members))
+        ]
+    else:
+        k = next((i for i, m in enumerate(members) if m[0] == node_id), None)
+        if k is None:
+            return []
+        pairs = [(members[i], members[k]) for i in range(k)] + [
+            (members[k], members[j]) for j in range(k + 1, len(members))
+        ]
+
+    edges = []
+    for (source, source_origins, source_columns), (
+        target,
+        target_origins,
+        target_columns,
+    ) in pairs:
+        origins = source_origins & target_origins
+        if not origins:
+            continue
+        for u, v, u_columns, v_columns in [
+            (source, target, source_columns, target_columns),
+            (target, source, target_columns, source_columns),
+        ]:
+            if any(
+                attr.get("data", {}).get("type") == "1-n"
+                or (
+                    attr.get("data", {}).get("type") == "1-1"
+                    and attr.get("data", {}).get("via_idtype") is not None
+                )
+                for attr in G.get_edge_data(u, v, default={}).values()
+            ):
+                # already related through an eagerly derived idtype, or superseded by
+                # a 1-n relation
+                continue
+            relation = _get_one_to_one_relation(
+                u, v, idtype_node_id, u_columns, v_columns
+            )
+            relation_hash, _ = get_relation_string(relation)
+            edges.append(
+                (
+                    u,
+                    v,
+                    relation_hash,
+                    {
+                        "data": {
+                            "via_idtype": idtype_node_id,
+                            "origins": set(origins),
+                            **relation,
+                        }
+                    },
+                )
+            )
+    return edges
+
+
+def get_implicit_one_to_one_relations(
+    G: nx.MultiDiGraph, node_id: str | None = None
+) -> list[tuple[str, str, str, dict]]:
+    implicit_idtypes = G.graph.get("implicit_idtypes", {})
+    if node_id is None:
+        idtype_node_ids = [n for n in G.nodes if n in implicit_idtypes]
+    elif node_id in G:
+        successors = {n for n in G.successors(node_id) if n in implicit_idtypes}
+        idtype_node_ids = [n for n in G.nodes if n in successors]
+    else:
+        idtype_node_ids = []
+
+    # Like the eager derivation, whose 1-1 relations of a pair share one key and are
+    # replaced by the last one inserted, a pair sharing several implicit idtypes is
+    # related once, via the last of them in the order of the graph, in all landscapes
+    # relating it through any of them. The eager derivation relates it via the last
+    # idtype of the last landscape relating it, which is the same idtype unless the
+    # landscapes relate the pair through different idtypes, or list them in a
+    # different order, than the graph. The columns are the ones of the merged
+    # entities. Pairs already related through an eagerly derived idtype keep that
+    # relation whatever the order of the idtypes: with both hubs and eager idtypes,
+    # via_idtype can differ from the one of deriving all idtypes eagerly
+    edges = {}
+    for idtype_node_id in idtype_node_ids:
+        for u, v, key, attr in _get_implicit_one_to_one_edges(
+            G, idtype_node_id, node_id
+        ):
+            if (u, v) in edges:
+                attr["data"]["origins"] |= edges[(u, v)][3]["data"]["origins"]
+            edges[(u, v)] = (u, v, key, attr)
+    return list(edges.values())
+
+
+@instrument_stage
+def expand_implicit_idtype_relations(G_In: nx.MultiDiGraph) -> nx.MultiDiGraph:
     G = G_In.copy()
+    G.add_edges_from(get_implicit_one_to_one_relations(G))
+    G.graph.pop("implicit_idtypes", None)
+    return G
+
+
+def _add_one_to_n_relations(
+    G: nx.MultiDiGraph, payload: dict, landscape_name: str
+) -> None:
     for relation in payload.get("relations", []):
         if relation.get("type") == "1-n":
             relation_hash, _ = get_relation_string(relation)
@@ -333,13 +522,20 @@ def populate_one_to_n_relations(
                         },
                     },
                 )
-    return G
 
 
-def populate_ordino_drilldown_relations(
+@instrument_stage
+def populate_one_to_n_relations(
     G_In: nx.MultiDiGraph, payload: dict, landscape_name: str
 ) -> nx.MultiDiGraph:
     G = G_In.copy()
+    _add_one_to_n_relations(G, payload, landscape_name)
+    return G
+
+
+def _add_ordino_drilldown_relations(
+    G: nx.MultiDiGraph, payload: dict, landscape_name: str
+) -> None:
     for relation in payload.get("relations", []):
         if relation.get("type") == "ordino-drilldown":
             relation_hash, _ = get_relation_string(relation)
@@ -408,9 +604,45 @@ def populate_ordino_drilldown_relations(
                         },
                     },
                 )
+
+
+@instrument_stage
+def populate_ordino_drilldown_relations(
+    G_In: nx.MultiDiGraph, payload: dict, landscape_name: str
+) -> nx.MultiDiGraph:
+    G = G_In.copy()
+    _add_ordino_drilldown_relations(G, payload, landscape_name)
+    return G
+
+
+# version of the graphs built by build_landscape_graph, graphs cached on disk by an
+# older version are built again
+LANDSCAPE_GRAPH_VERSION = 1
+
+
+@instrument_stage
+def build_landscape_graph(
+    payload: dict, landscape_name: str, max_idtype_fanout: int | None = None
+) -> nx.MultiDiGraph:
+    """
+    Build the populated graph of a landscape in one pass, without copying the graph
+    between the populate_* stages. Its relations are deduplicated as they are
+    inserted (see `LandscapeGraph`).
+
+    idtypes connecting more than `max_idtype_fanout` entities are kept as implicit
+    hubs whose 1-1 relations are synthesized on demand by
+    `get_implicit_one_to_one_relations`. `None` derives all 1-1 relations eagerly.
+    """
+    G = LandscapeGraph()
+    _add_idtype_nodes(G, payload.get("idtypes", []), landscape_name)
+    _add_entity_nodes(G, _get_entities(payload), landscape_name)
+    _add_idtype_relations(G, landscape_name, max_idtype_fanout)
+    _add_one_to_n_relations(G, payload, landscape_name)
+    _add_ordino_drilldown_relations(G, payload, landscape_name)
     return G
 
 
+@instrument_stage
 def remove_uploaded_dataset_from_graph(
     G_In: nx.MultiDiGraph, dataset_id: str
 ) -> nx.MultiDiGraph:
@@ -418,7 +650,7 @@ def remove_uploaded_dataset_from_graph(
 
     nodes_to_remove = [
         n
-        for n, attr in G.nodes(data=True)
+        for n, attr in get_uploaded_nodes(G)
         if dataset_id == attr.get("data", {}).get("id", None)
     ]
     G.remove_nodes_from(nodes_to_remove)
@@ -432,8 +664,8 @@ def get_relations_for_node(G: nx.MultiDiGraph, node_id: str) -> list[dict]:
         return relations
 
     for adjacent in list(G.neighbors(node_id)) + list(G.predecessors(node_id)):
-        for key in G[node_id][adjacent]:
-            edge_data = G[node_id][adjacent][key].get("data", {})
+        for attr in G.get_edge_data(node_id, adjacent, default={}).values():
+            edge_data = attr.get("data", {})
             # if not edge_data.get("is_derived", False):
             relations.append(
                 {
@@ -443,29 +675,194 @@ def get_relations_for_node(G: nx.MultiDiGraph, node_id: str) -> list[dict]:
                 }
             )
 
+    for u, v, _, attr in get_implicit_one_to_one_relations(G, node_id):
+        if u == node_id:
+            relations.append(
+                {
+                    "source": u,
+                    "target": v,
+                    **attr.get("data", {}),
+                }
+            )
+
     return relations
 
 
+@instrument_stage
 def merge_graphs(
     Gs: list[nx.MultiDiGraph],
 ) -> nx.MultiDiGraph:
     G_merged = nx.compose_all(Gs)
+    # compose_all keeps the graph attributes of the last graph only
+    implicit_idtypes = {}
+    for G in Gs:
+        for idtype, landscapes in G.graph.get("implicit_idtypes", {}).items():
+            implicit_idtypes[idtype] = {
+                *implicit_idtypes.get(idtype, set()),
+                *landscapes,
+            }
+    if implicit_idtypes:
+        G_merged.graph["implicit_idtypes"] = implicit_idtypes
     return G_merged
 
 
+def _get_merged_origins(*datas: dict) -> set[str]:
+    return {origin for data in datas for origin in data.get("origins", [])}
+
+
+def _add_landscape_edge(G: LandscapeGraph, u: str, v: str, k: str, attr: dict) -> None:
+    if G.has_edge(u, v, k):
+        data = G.edges[u, v, k].get("data", {})
+        origins = _get_merged_origins(data, attr.get("data", {}))
+        G.add_edge(
+            u, v, k, **{**attr, "data": {**attr.get("data", {}), "origins": origins}}
+        )
+    else:
+        G.add_edge(u, v, k, **attr)
+
+
+@instrument_stage
+def add_landscape_to_graph(G: LandscapeGraph, G_landscape: nx.MultiDiGraph) -> None:
+    """
+    Add the nodes and relations of a landscape graph to the global graph in place.
+
+    Elements already in the global graph take the payload of the landscape, their
+    origins are the union of all landscapes contributing them.
+    """
+    for n, attr in G_landscape.nodes(data=True):
+        # nodes without payload are endpoints of relations only
+        if n in G and "data" in G.nodes[n]:
+            data = G.nodes[n]["data"]
+            origins = _get_merged_origins(data, attr.get("data", {}))
+            G.add_node(
+                n, **{**attr, "data": {**attr.get("data", data), "origins": origins}}
+            )
+        else:
+            G.add_node(n, **attr)
+
+    for u, v, k, attr in G_landscape.edges(keys=True, data=True):
+        _add_landscape_edge(G, u, v, k, attr)
+
+    implicit_idtypes = _get_implicit_idtypes(G)
+    for idtype, landscapes in _get_implicit_idtypes(G_landscape).items():
+        implicit_idtypes[idtype] = {*implicit_idtypes.get(idtype, set()), *landscapes}
+    if implicit_idtypes:
+        G.graph["implicit_idtypes"] = implicit_idtypes
+
+
+@instrument_stage
+def add_uploaded_landscape_to_graph(
+    G: LandscapeGraph,
+    G_uploaded: nx.MultiDiGraph,
+    landscape_name: str,
+    max_idtype_fanout: int | None = None,
+) -> None:
+    """
+    Add the uploaded datasets to the global graph in place and derive their idtype
+    relations against all entities of the global graph.
+    """
+    add_landscape_to_graph(G, G_uploaded)
+    _add_idtype_relations(G, landscape_name, max_idtype_fanout)
+
+
+@instrument_stage
+def remove_landscape_from_graph(
+    G: LandscapeGraph, landscape_name: str, Gs: list[nx.MultiDiGraph]
+) -> None:
+    """
+    Remove the contribution of a landscape from the global graph in place.
+
+    The landscape is removed from the origins of its nodes and relations, elements
+    without origins left are deleted. Relations of the remaining landscape graphs
+    `Gs` which were superseded by a deleted relation are added again.
+    """
+    removed_edges = []
+    for u, v, k in G.edges_of_origin(landscape_name):
+        attr = G.edges[u, v, k]
+        data = attr.get("data", {})
+        origins = _get_merged_origins(data) - {landscape_name}
+        # a relation kept for all relations of its class between u and v may have
+        # the key of the removed landscape, they are resolved again from the
+        # remaining landscapes
+        is_resolved_again = get_relation_class(data) is not None and any(
+            Gl.has_edge(u, v) for Gl in Gs
+        )
+        if origins and not is_resolved_again:
+            # the payload is the one of the last added landscape, like for the nodes
+            attr = next(
+                (Gl.edges[u, v, k] for Gl in reversed(Gs) if Gl.has_edge(u, v, k)),
+                attr,
+            )
+            G.add_edge(
+                u,
+                v,
+                k,
+                **{**attr, "data": {**attr.get("data", {}), "origins": origins}},
+            )
+        else:
+            G.remove_edge(u, v, k)
+            removed_edges.append((u, v))
+
+    for n in G.nodes_of_origin(landscape_name):
+        attr = G.nodes[n]
+        origins = _get_merged_origins(attr.get("data", {})) - {landscape_name}
+        remaining_attrs = [Gl.nodes[n] for Gl in Gs if n in Gl]
+        # nodes still referenced by relations of the remaining landscapes are kept
+        if origins or remaining_attrs:
+            # the payload is the one of the last added landscape, as if the
+            # remaining landscapes were added again
+            data = next(
+                (a["data"] for a in reversed(remaining_attrs) if "data" in a),
+                None if remaining_attrs else attr.get("data", {}),
+            )
+            if data is not None:
+                G.add_node(n, **{**attr, "data": {**data, "origins": origins}})
+            else:
+                # nodes only kept as endpoints have no payload, like in their landscape
+                G.replace_node(n, **{k: v for k, v in attr.items() if k != "data"})
+        else:
+            G.remove_node(n)
+
+    for u, v in dict.fromkeys(removed_edges):
+        if u not in G or v not in G:
+            continue
+        for G_landscape in Gs:
+            for k, attr in G_landscape.get_edge_data(u, v, default={}).items():
+                _add_landscape_edge(G, u, v, k, attr)
+
+    # endpoints of relations which are no nodes of any landscape
+    for n in {n for edge in removed_edges for n in edge}:
+        if (
+            n in G
+            and not G.nodes[n].get("data", {}).get("origins")
+            and G.degree(n) == 0
+        ):
+            G.remove_node(n)
+
+    implicit_idtypes = {
+        idtype: landscapes - {landscape_name}
+        for idtype, landscapes in _get_implicit_idtypes(G).items()
+        if landscapes - {landscape_name}
+    }
+    if implicit_idtypes:
+        G.graph["implicit_idtypes"] = implicit_idtypes
+    else:
+        G.graph.pop("implicit_idtypes", None)
+
+
+@instrument_stage
 def deduplicate_relations(G: nx.MultiDiGraph) -> nx.MultiDiGraph:
+    if isinstance(G, LandscapeGraph):
+        # relations are already deduplicated when they are inserted
+        return G
+
     idtype_relations = [
         (u, v, k, attr)
-        for u, v, k, attr in G.edges(data=True, keys=True)
-        if attr.get("data", {}).get("type") == "1-1"
-        and attr.get("data", {}).get("via_idtype") is not None
+        for u, v, k, attr in get_edges_of_type(G, "1-1")
+        if attr.get("data", {}).get("via_idtype") is not None
     ]
 
-    one_to_n_relations = [
-        (u, v, k, attr)
-        for u, v, k, attr in G.edges(data=True, keys=True)
-        if attr.get("data", {}).get("type") == "1-n"
-    ]
+    one_to_n_relations = get_edges_of_type(G, "1-n")
 
     # ordino_drilldown_relations = [
     #     (u, v, k, attr)
@@ -474,13 +871,13 @@ def deduplicate_relations(G: nx.MultiDiGraph) -> nx.MultiDiGraph:
     # ]
 
     # find all the edges which have the same u and v
-    uniques = []
+    uniques = set()
     duplicates = []
     for relations in [one_to_n_relations, idtype_relations]:
         for u, v, k, _ in relations:
-            edge_signature = f"{u}-{v}"
+            edge_signature = (u, v)
             if edge_signature not in uniques:
-                uniques.append(edge_signature)
+                uniques.add(edge_signature)
             else:
                 duplicates.append((u, v, k))
 
@@ -508,34 +905,72 @@ def deduplicate_relations(G: nx.MultiDiGraph) -> nx.MultiDiGraph:
     return G
 
 
+def get_filtered_graph(
+    G: nx.MultiDiGraph,
+    hidden_node_types: Collection[str] = (),
+    remove_isolated_nodes: bool = False,
+    origins: Collection[str] | None = None,
+    relation_types: Collection[str] | None = None,
+) -> nx.MultiDiGraph:
+    """
+    Read-only view of G without the nodes of the hidden types, and with only the
+    nodes and relations of the given origins and the relations of the given types.
+    Isolated nodes are those without a relation in the filtered view.
+
+    Nothing is copied, the filters are evaluated as the view is read, so views can
+    be filtered further.
+    """
+    origins = None if origins is None else set(origins)
+
+    def is_visible_node(n) -> bool:
+        data = G.nodes[n].get("data", {})
+        if data.get("type") in hidden_node_types:
+            return False
+        return origins is None or not origins.isdisjoint(data.get("origins", []))
+
+    def is_visible_edge(u, v, key) -> bool:
+        data = G.edges[u, v, key].get("data", {})
+        if relation_types is not None and data.get("type") not in relation_types:
+            return False
+        return origins is None or not origins.isdisjoint(data.get("origins", []))
+
+    filter_node = is_visible_node if hidden_node_types or origins is not None else None
+    filter_edge = (
+        is_visible_edge if relation_types is not None or origins is not None else None
+    )
+    SG = G
+    if filter_node is not None or filter_edge is not None:
+        SG = nx.subgraph_view(
+            G,
+            filter_node=filter_node or nx.filters.no_filter,
+            filter_edge=filter_edge or nx.filters.no_filter,
+        )
+    if not remove_isolated_nodes:
+        return SG
+
+    # each node is read for every relation it is part of, its degree is taken once
+    @cache
+    def is_related_node(n) -> bool:
+        return any(True for _ in SG.succ[n]) or any(True for _ in SG.pred[n])
+
+    return nx.subgraph_view(SG, filter_node=is_related_node)
+
+
 def get_subgraph_with_idtype_nodes(
     G: nx.MultiDiGraph, with_idtype_nodes: bool
 ) -> nx.MultiDiGraph:
-    if with_idtype_nodes:
-        return G
-    else:
-        SG = G.copy()
-        nodes_to_hide = [
-            n
-            for n, attr in G.nodes(data=True)
-            if attr.get("data", {}).get("type") == "idtype"
-        ]
-        filter = nx.filters.hide_nodes(nodes_to_hide)
-        SG = nx.subgraph_view(SG, filter_node=filter)
-        return SG
+    return get_filtered_graph(
+        G, hidden_node_types=() if with_idtype_nodes else ["idtype"]
+    )
 
 
 def get_subgraph_with_isolated_nodes_removed(
     G: nx.MultiDiGraph, remove_isolated_nodes: bool
 ) -> nx.MultiDiGraph:
-    SG = G.copy()
-
-    if remove_isolated_nodes:
-        SG.remove_nodes_from(list(nx.isolates(G)))
-
-    return SG
+    return get_filtered_graph(G, remove_isolated_nodes=remove_isolated_nodes)
 
 
+@instrument_stage
 def get_flattened_landscape(G: nx.MultiDiGraph) -> dict:
     flattened_landscape = {
         "idtypes": [],
@@ -544,16 +979,12 @@ def get_flattened_landscape(G: nx.MultiDiGraph) -> dict:
     }
 
     idtype_nodes = [
-        attr.get("data", {})
-        for n, attr in G.nodes(data=True)
-        if attr.get("data", {}).get("type") == "idtype"
+        expand_data(attr.get("data", {})) for n, attr in get_nodes_of_type(G, "idtype")
     ]
     flattened_landscape["idtypes"] = idtype_nodes
 
     entity_nodes = [
-        attr.get("data", {})
-        for n, attr in G.nodes(data=True)
-        if attr.get("data", {}).get("type") == "entity"
+        expand_data(attr.get("data", {})) for n, attr in get_nodes_of_type(G, "entity")
     ]
 
     # group entities by database and schema
@@ -600,9 +1031,92 @@ def get_flattened_landscape(G: nx.MultiDiGraph) -> dict:
             "target": v,
             **attr.get("data", {}),
         }
-        for u, v, attr in G.edges(data=True)
-        if not attr.get("data", {}).get("is_derived", False)
+        for u, v, k, attr in get_derived_edges(G, is_derived=False)
     ]
     flattened_landscape["relations"] = relation_edges
 
     return flattened_landscape
+
+
+@instrument_stage
+def get_node_link_data(G: nx.MultiDiGraph) -> dict:
+    data = json_graph.node_link_data(G)
+    # compact data is only expanded when the graph is serialized
+    for element in [*data["nodes"], *data["edges"]]:
+        if "data" in element:
+            element["data"] = expand_data(element["data"])
+    return data
+
+
+def _get_node_link_element(attr: dict, **element) -> dict:
+    element = {**attr, **element}
+    if "data" in element:
+        element["data"] = expand_data(element["data"])
+    return element
+
+
+@instrument_stage
+def get_node_link_delta(G: nx.MultiDiGraph, changes: dict[tuple, dict | None]) -> dict:
+    """
+    Node-link data of the nodes and edges added, changed and removed in G, from
+    the changes recorded by LandscapeGraph.pop_changes. Removed nodes are listed by
+    their id, removed edges by their source, target and key.
+    """
+    delta = {
+        "graph": G.graph,
+        "nodes": {"added": [], "changed": [], "removed": []},
+        "edges": {"added": [], "changed": [], "removed": []},
+    }
+    for element, previous_attr in changes.items():
+        if element[0] == "node":
+            n = element[1]
+            attr = G.nodes[n] if n in G else None
+            ids = {"id": n}
+            removed = n
+            elements = delta["nodes"]
+        else:
+            _, u, v, k = element
+            attr = G.edges[u, v, k] if G.has_edge(u, v, k) else None
+            ids = removed = {"source": u, "target": v, "key": k}
+            elements = delta["edges"]
+
+        if attr is None:
+            if previous_attr is not None:
+                elements["removed"].append(removed)
+        elif previous_attr is None:
+            elements["added"].append(_get_node_link_element(attr, **ids))
+        elif previous_attr != attr:
+            elements["changed"].append(_get_node_link_element(attr, **ids))
+    return delta
+
+
+def _get_json_default(value):
+    # origins are kept as sets, they are written as lists like jsonable_encoder does
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+@instrument_stage
+def get_json_bytes(data) -> bytes:
+    """
+    Serialize node-link data to the bytes FastAPI would respond with, without
+    walking it through jsonable_encoder first. orjson is used when installed.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                data, default=_get_json_default, option=orjson.OPT_NON_STR_KEYS
+            )
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, the standard encoder handles them
+            pass
+    return json.dumps(
+        data,
+        default=_get_json_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from uuid import uuid4
+
+_log = logging.getLogger(__name__)
+
+# errors of the inputs of a job, e.g. missing or malformed landscape files
+_job_errors = (OSError, ValueError, KeyError, TypeError, AttributeError)
+
+
+class JobCancelledError(Exception):
+    pass
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class Job:
+    """
+    A background job running the stages of a pipeline, with the progress of each
+    stage. Cancellation is cooperative, the job checks for it between its steps.
+    """
+
+    def __init__(self, stages: dict[str, int]):
+        self.id = uuid4().hex
+        self.status = "queued"
+        self.stages = {
+            stage: {"done": 0, "total": total} for stage, total in stages.items()
+        }
+        self.result = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.finished_at: float | None = None
+        self._cancelled = threading.Event()
+        self._future: Future | None = None
+
+    def advance(self, stage: str) -> None:
+        self.stages[stage] = {
+            **self.stages[stage],
+            "done": self.stages[stage]["done"] + 1,
+        }
+
+    def check_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise JobCancelledError
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        # jobs still queued never start
+        if self._future is not None and self._future.cancel():
+            self._finish("cancelled")
+
+    def _fail(self, e: BaseException) -> None:
+        self.error = f"{type(e).__name__}: {e}"
+        self._finish("failed")
+
+    def _finish(self, status: str) -> None:
+        self.status = status
+        self.finished_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stages": self.stages,
+            "result": self.result,
+            "error": self.error,
+            "createdAt": self.created_at,
+            "finishedAt": self.finished_at,
+        }
+
+
+class JobExecutor:
+    """
+    Runs jobs on a bounded pool of threads. Jobs beyond `max_pending` queued or
+    running ones are refused, the last `max_finished` finished jobs are kept to be
+    looked up.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, max_finished: int = 100):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, job: Job, run: Callable[[Job], object]) -> Job:
+        with self._lock:
+            pending = [j for j in self._jobs.values() if j.finished_at is None]
+            if len(pending) >= self.max_pending:
+                raise JobQueueFullError(f"{len(pending)} jobs are pending")
+            self._jobs[job.id] = job
+            finished = [j.id for j in self._jobs.values() if j.finished_at is not None]
+            for job_id in finished[: max(len(finished) - self.max_finished, 0)]:
+                del self._jobs[job_id]
+            job._future = self._executor.submit(self._run, job, run)
+        return job
+
+    def _run(self, job: Job, run: Callable[[Job], object]) -> None:
+        if job._cancelled.is_set():
+            job._finish("cancelled")
+            return
+        job.status = "running"
+        try:
+            job.result = run(job)
+        except JobCancelledError:
+            job._finish("cancelled")
+        except _job_errors as e:
+            _log.warning("Job %s failed: %s: %s", job.id, type(e).__name__, e)
+            job._fail(e)
+        except Exception as e:
+            # the job fails on any other error as well, which is raised to its future
+            _log.exception("Job %s failed unexpectedly", job.id)
+            job._fail(e)
+            raise
+        else:
+            job._finish("done")
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
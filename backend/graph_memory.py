@@ -0,0 +1,161 @@
+import heapq
+import random
+import sys
+from collections.abc import Mapping
+
+import networkx as nx
+
+_leaf_types = (str, bytes, int, float, bool, type(None))
+
+
+def _get_slots(obj: object) -> list:
+    return [
+        getattr(obj, slot)
+        for cls in type(obj).__mro__
+        for slot in cls.__dict__.get("__slots__", ())
+        if hasattr(obj, slot)
+    ]
+
+
+def _get_referents(obj: object) -> list | None:
+    if isinstance(obj, dict):
+        return [*obj.keys(), *obj.values()]
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return list(obj)
+    if isinstance(obj, nx.Graph):
+        return list(vars(obj).values())
+    if hasattr(type(obj), "__slots__"):
+        return _get_slots(obj)
+    return None
+
+
+class MemoryWalker:
+    """
+    Approximate the memory retained by objects, counting each object once across
+    all walks: objects shared with an object walked before are not counted again.
+
+    Containers with more than `sample_size` items are walked through a random
+    sample of their items, whose sizes are extrapolated to all items. The sizes are
+    estimates, their cost is bounded by the sample size rather than the data.
+    """
+
+    def __init__(self, sample_size: int = 256, seed: int = 0):
+        self.sample_size = sample_size
+        self._seen: set[int] = set()
+        self._rng = random.Random(seed)
+        # the walked objects are kept alive, their ids stay unique
+        self._walked: list[object] = []
+
+    def copy(self) -> "MemoryWalker":
+        walker = MemoryWalker(self.sample_size)
+        walker._seen = set(self._seen)
+        walker._walked = self._walked
+        return walker
+
+    def get_size(self, obj: object) -> int:
+        size = 0.0
+        stack = [(obj, 1.0)]
+        while stack:
+            obj, weight = stack.pop()
+            if id(obj) in self._seen:
+                continue
+            self._seen.add(id(obj))
+            self._walked.append(obj)
+            size += sys.getsizeof(obj) * weight
+            if isinstance(obj, _leaf_types):
+                continue
+            referents = _get_referents(obj)
+            if not referents:
+                continue
+            if len(referents) > self.sample_size:
+                weight *= len(referents) / self.sample_size
+                referents = self._rng.sample(referents, self.sample_size)
+            stack.extend((referent, weight) for referent in referents)
+        return round(size)
+
+
+def _get_origins(attr: Mapping) -> list[str]:
+    return list(attr.get("data", {}).get("origins", ()))
+
+
+def _sample(elements: list, sample_size: int, rng: random.Random) -> list:
+    return (
+        elements if len(elements) <= sample_size else rng.sample(elements, sample_size)
+    )
+
+
+def get_memory_usage(
+    landscapes: dict[str, tuple[str, dict]],
+    landscape_graphs: dict[str, nx.MultiDiGraph],
+    G: nx.MultiDiGraph,
+    top: int = 10,
+    sample_size: int = 256,
+) -> dict:
+    """
+    Report the approximate memory retained by each landscape: its JSON document,
+    its landscape graph and its share of the global graph G, and the heaviest nodes
+    and edges of G.
+
+    Memory shared with the document or the graph of a landscape is counted for that
+    landscape only. The memory G does not share with the landscape graphs is split
+    between the origins of its nodes and edges, from a sample of at most
+    `sample_size` nodes and `sample_size` edges.
+    """
+    walker = MemoryWalker(sample_size)
+    report = {
+        name: {
+            "json": walker.get_size(landscape_json),
+            "graph": walker.get_size(landscape_graphs.get(name)),
+            "sharedGraph": 0,
+        }
+        for name, (_, landscape_json) in landscapes.items()
+    }
+
+    # the attributes of the nodes and edges are measured apart from the structure of
+    # G, with what G shares with the landscapes already counted
+    element_walker = walker.copy()
+    graph_size = walker.get_size(G)
+
+    rng = random.Random(0)
+    nodes = _sample(list(G.nodes), sample_size, rng)
+    edges = _sample(list(G.edges(keys=True)), sample_size, rng)
+    node_sizes = [(element_walker.get_size(G._node[n]), n) for n in nodes]
+    edge_sizes = [
+        (element_walker.get_size(G._succ[u][v][k]), (u, v, k)) for u, v, k in edges
+    ]
+
+    unattributed = graph_size
+    for sizes, total, get_attr in [
+        (node_sizes, G.number_of_nodes(), lambda n: G._node[n]),
+        (edge_sizes, G.number_of_edges(), lambda e: G._succ[e[0]][e[1]][e[2]]),
+    ]:
+        scale = total / len(sizes) if sizes else 0
+        for size, element in sizes:
+            origins = [o for o in _get_origins(get_attr(element)) if o in report]
+            for origin in origins:
+                report[origin]["sharedGraph"] += round(size * scale / len(origins))
+            if origins:
+                unattributed -= size * scale
+
+    for usage in report.values():
+        usage["total"] = usage["json"] + usage["graph"] + usage["sharedGraph"]
+    landscapes_size = sum(usage["json"] + usage["graph"] for usage in report.values())
+    return {
+        "landscapes": report,
+        "graph": {
+            "nodes": G.number_of_nodes(),
+            "edges": G.number_of_edges(),
+            "bytes": graph_size,
+            "unattributed": max(round(unattributed), 0),
+        },
+        "total": landscapes_size + graph_size,
+        "heaviestNodes": [
+            {"id": n, "bytes": size}
+            for size, n in heapq.nlargest(top, node_sizes, key=lambda s: s[0])
+        ],
+        "heaviestEdges": [
+            {"source": u, "target": v, "key": k, "bytes": size}
+            for size, (u, v, k) in heapq.nlargest(top, edge_sizes, key=lambda s: s[0])
+        ],
+        "sampled": len(nodes) < G.number_of_nodes() or len(edges) < G.number_of_edges(),
+    }
@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from functools import wraps
+
+import networkx as nx
+
+# the pipeline functions and routes are only wrapped if metrics are enabled, they
+# run unchanged otherwise
+metrics_enabled: bool = os.environ.get("GRAPH_METRICS", "1") != "0"
+
+_duration_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+_duration_buckets += (2.5, 5.0, 10.0, 30.0)
+_size_buckets = tuple(float(4**i * 1024) for i in range(9))
+
+_metrics: list["Counter | Histogram"] = []
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = {
+        name: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            labels = _format_labels(dict(zip(self.label_names, key)))
+            lines.append(f"{self.name}{labels} {float(value)!r}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: tuple[str, ...],
+        buckets: tuple[float, ...] = _duration_buckets,
+    ):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        # per labels: the count of each bucket and of +Inf, the sum
+        self._values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = [
+                (key, list(counts), total)
+                for key, (counts, total) in self._values.items()
+            ]
+        for key, counts, total in values:
+            labels = dict(zip(self.label_names, key))
+            cumulative = 0
+            bounds = [*(repr(float(bound)) for bound in self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = _format_labels({**labels, "le": bound})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {float(total)!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+stage_duration = Histogram(
+    "landscape_stage_duration_seconds",
+    "Duration of the stages of the landscape pipeline.",
+    ("stage",),
+)
+stage_nodes = Counter(
+    "landscape_stage_nodes_total",
+    "Nodes of the graphs produced by the stages of the landscape pipeline.",
+    ("stage",),
+)
+stage_edges = Counter(
+    "landscape_stage_edges_total",
+    "Edges of the graphs produced by the stages of the landscape pipeline.",
+    ("stage",),
+)
+stage_output_size = Histogram(
+    "landscape_stage_output_bytes",
+    "Size of the payloads serialized by the stages of the landscape pipeline.",
+    ("stage",),
+    _size_buckets,
+)
+request_duration = Histogram(
+    "graph_request_duration_seconds",
+    "Duration of the graph routes, until their response is ready to be sent.",
+    ("method", "route", "status"),
+)
+response_size = Histogram(
+    "graph_response_size_bytes",
+    "Size of the responses of the graph routes, streamed responses excluded.",
+    ("method", "route"),
+    _size_buckets,
+)
+
+
+# the stages run by the calls of call_recording_stages in this thread
+_recording = threading.local()
+
+# a recorded stage: its name, duration, and the nodes and edges of its graph or the
+# size of its payload
+StageRecord = tuple[str, float, int | None, int | None, int | None]
+
+
+def record_stages(records: list[StageRecord]) -> None:
+    """
+    Record the stages run by `call_recording_stages`, e.g. in a worker process.
+    """
+    for stage, seconds, nodes, edges, size in records:
+        stage_duration.observe(seconds, stage=stage)
+        if nodes is not None:
+            stage_nodes.inc(nodes, stage=stage)
+            stage_edges.inc(edges, stage=stage)
+        if size is not None:
+            stage_output_size.observe(size, stage=stage)
+        records_of_caller = getattr(_recording, "records", None)
+        if records_of_caller is not None:
+            records_of_caller.append((stage, seconds, nodes, edges, size))
+
+
+def call_recording_stages(func: Callable, *args) -> tuple[object, list[StageRecord]]:
+    """
+    Call `func` and return its result with the stages it ran, for the process the
+    call ran for to record them with `record_stages`.
+    """
+    records_of_caller = getattr(_recording, "records", None)
+    _recording.records = []
+    try:
+        result = func(*args)
+        return result, _recording.records
+    finally:
+        _recording.records = records_of_caller
+
+
+def instrument_stage(func: Callable) -> Callable:
+    """
+    Record the duration of a pipeline function, the size of the graph or of the
+    payload it returns.
+    """
+    if not metrics_enabled:
+        return func
+    stage = func.__name__
+
+    @wraps(func)
+    def instrumented(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        nodes = edges = size = None
+        if isinstance(result, nx.Graph):
+            nodes, edges = result.number_of_nodes(), result.number_of_edges()
+        elif isinstance(result, bytes):
+            size = len(result)
+        record_stages([(stage, seconds, nodes, edges, size)])
+        return result
+
+    return instrumented
+
+
+def get_metrics_text() -> str:
+    """
+    The metrics in the Prometheus text exposition format.
+    """
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
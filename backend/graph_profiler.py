@@ -0,0 +1,174 @@
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+import zipfile
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import wraps
+from uuid import uuid4
+
+# the traces of tracemalloc itself are left out of the reports
+_trace_filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+class ProfileCapture:
+    """
+    The profiles of the next `requests` requests to a route: the cProfile stats and
+    the top allocations traced by tracemalloc of each request.
+    """
+
+    def __init__(self, route: str, requests: int):
+        self.id = uuid4().hex
+        self.route = route
+        self.requests = requests
+        self.cancelled = False
+        self.created_at = time.time()
+        # per request: the marshalled cProfile stats and the report
+        self.profiles: list[tuple[bytes, str]] = []
+        self._remaining = requests
+
+    @property
+    def status(self) -> str:
+        if len(self.profiles) == self.requests:
+            return "done"
+        if self.cancelled:
+            return "cancelled"
+        return "armed" if self._remaining else "capturing"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "route": self.route,
+            "status": self.status,
+            "requests": self.requests,
+            "captured": len(self.profiles),
+            "createdAt": self.created_at,
+        }
+
+    def to_zip(self) -> bytes:
+        """
+        The profiles as a zip archive, the .prof files are read by pstats and the
+        tools built on it, like snakeviz.
+        """
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for i, (stats, report) in enumerate(self.profiles, 1):
+                archive.writestr(f"request-{i}.prof", stats)
+                archive.writestr(f"request-{i}.txt", report)
+        return buffer.getvalue()
+
+
+class RequestProfiler:
+    """
+    Profiles the requests of the routes it wraps once it is armed for them. Requests
+    to routes which are not armed only check that nothing is armed.
+
+    The profiled requests run one at a time, the allocations traced during a request
+    include those of the requests running concurrently.
+    """
+
+    def __init__(self, max_captures: int = 10, top: int = 40):
+        self.max_captures = max_captures
+        self.top = top
+        self.routes: set[str] = set()
+        self._armed: dict[str, ProfileCapture] = {}
+        self._captures: OrderedDict[str, ProfileCapture] = OrderedDict()
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+
+    def wrap(self, route: str, func: Callable) -> Callable:
+        self.routes.add(route)
+
+        @wraps(func)
+        def profiled(*args, **kwargs):
+            if not self._armed:
+                return func(*args, **kwargs)
+            capture = self._take(route)
+            if capture is None:
+                return func(*args, **kwargs)
+            return self._profile(capture, func, args, kwargs)
+
+        return profiled
+
+    def arm(self, route: str, requests: int) -> ProfileCapture:
+        capture = ProfileCapture(route, requests)
+        with self._lock:
+            previous = self._armed.get(route)
+            if previous is not None:
+                previous.cancelled = True
+            self._armed[route] = capture
+            self._captures[capture.id] = capture
+            while len(self._captures) > self.max_captures:
+                self._captures.popitem(last=False)
+        return capture
+
+    def disarm(self, capture: ProfileCapture) -> None:
+        with self._lock:
+            capture.cancelled = True
+            capture._remaining = 0
+            if self._armed.get(capture.route) is capture:
+                del self._armed[capture.route]
+
+    def get(self, capture_id: str) -> ProfileCapture | None:
+        return self._captures.get(capture_id)
+
+    def _take(self, route: str) -> ProfileCapture | None:
+        with self._lock:
+            capture = self._armed.get(route)
+            if capture is None:
+                return None
+            capture._remaining -= 1
+            if not capture._remaining:
+                del self._armed[route]
+            return capture
+
+    def _profile(self, capture: ProfileCapture, func: Callable, args, kwargs):
+        with self._profile_lock:
+            tracing = tracemalloc.is_tracing()
+            before = (
+                tracemalloc.take_snapshot().filter_traces(_trace_filters)
+                if tracing
+                else None
+            )
+            if not tracing:
+                tracemalloc.start()
+            profile = cProfile.Profile()
+            start = time.perf_counter()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                snapshot = tracemalloc.take_snapshot().filter_traces(_trace_filters)
+                if not tracing:
+                    tracemalloc.stop()
+                self._add_profile(capture, profile, seconds, snapshot, before)
+
+    def _add_profile(
+        self,
+        capture: ProfileCapture,
+        profile: cProfile.Profile,
+        seconds: float,
+        snapshot: tracemalloc.Snapshot,
+        before: tracemalloc.Snapshot | None,
+    ) -> None:
+        report = io.StringIO()
+        report.write(
+            f"{capture.route} request {len(capture.profiles) + 1} of "
+            f"{capture.requests}, {seconds * 1000:.1f} ms\n\n"
+        )
+        stats = pstats.Stats(profile, stream=report)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        report.write("Top allocations still held at the end of the request\n\n")
+        allocations = (
+            snapshot.compare_to(before, "lineno")
+            if before is not None
+            else snapshot.statistics("lineno")
+        )
+        for allocation in allocations[: self.top]:
+            report.write(f"{allocation}\n")
+        with self._lock:
+            capture.profiles.append((marshal.dumps(stats.stats), report.getvalue()))
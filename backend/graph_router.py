@@ -1,405 +1,1028 @@
+import asyncio
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import BrokenExecutor, Executor
+from dataclasses import dataclass, field, replace
+from itertools import chain, repeat
+from typing import Annotated
+from uuid import uuid4
 
 import networkx as nx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+
+import landscape_merge
 from graph import (
-    deduplicate_relations,
+    LANDSCAPE_GRAPH_VERSION,
+    add_landscape_to_graph,
+    add_uploaded_landscape_to_graph,
+    build_landscape_graph,
+    expand_implicit_idtype_relations,
+    get_filtered_graph,
     get_flattened_landscape,
+    get_json_bytes,
+    get_node_link_data,
+    get_node_link_delta,
     get_relations_for_node,
-    get_subgraph_with_idtype_nodes,
-    get_subgraph_with_isolated_nodes_removed,
-    merge_graphs,
     populate_graph,
     populate_idtype_relations,
     populate_one_to_n_relations,
     populate_ordino_drilldown_relations,
+    remove_landscape_from_graph,
     remove_uploaded_dataset_from_graph,
 )
-from networkx.readwrite import json_graph
+from graph_jobs import Job, JobExecutor, JobQueueFullError
+from graph_memory import get_memory_usage
+from graph_metrics import (
+    call_recording_stages,
+    metrics_enabled,
+    record_stages,
+    request_duration,
+    response_size,
+)
+from graph_profiler import ProfileCapture, RequestProfiler
+from graph_stream import GraphStream, format_event
+from landscape_files import LandscapeCatalog, LandscapeFileCache
+from landscape_graph import CompactLandscapeGraph, LandscapeGraph, to_compact_graph
+from landscape_graph_cache import LandscapeGraphCache
 from util import (
     generate_landscape_with_random_uploaded_dataset,
     generate_landscape_with_real_uploaded_dataset,
 )
 
-graph_router = APIRouter(prefix="/api/graph")
-
-# In-memory storage for the graph and landscape data
-G = nx.MultiDiGraph()
 
-loaded_landscapes_map: dict[str, tuple[str, dict]] = {}
-loaded_landscapes_graph_map: dict[str, nx.MultiDiGraph] = {}
+class _InstrumentedRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # requests to the synchronous routes can be profiled, their endpoint runs in
+        # a thread of its own
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = request_profiler.wrap(path, endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not metrics_enabled:
+            return handler
+        method = ",".join(sorted(self.methods))
+
+        async def instrumented_handler(request: Request) -> Response:
+            start = time.perf_counter()
+            status = "500"
+            try:
+                response = await handler(request)
+                status = str(response.status_code)
+            except HTTPException as e:
+                status = str(e.status_code)
+                raise
+            finally:
+                request_duration.observe(
+                    time.perf_counter() - start,
+                    method=method,
+                    route=self.path_format,
+                    status=status,
+                )
+            if not isinstance(response, StreamingResponse):
+                response_size.observe(
+                    len(response.body), method=method, route=self.path_format
+                )
+            return response
+
+        return instrumented_handler
+
+
+# the next requests to a route are profiled once it is armed through /profiles
+request_profiler = RequestProfiler()
+request_profiler_enabled: bool = os.environ.get("GRAPH_PROFILER") == "1"
+
+graph_router = APIRouter(prefix="/api/graph", route_class=_InstrumentedRoute)
+
+# keep the graphs in the compact, interned storage of CompactLandscapeGraph, their
+# data is only expanded when they are serialized
+compact_graph_storage: bool = os.environ.get("COMPACT_GRAPH_STORAGE") == "1"
 
 uploaded_landscape_name: str = "uploaded_dataset"
-uploaded_landscape = {
-    "databases": [
-        {
-            "id": "db",
-            "dbEngine": "postgresql",
-            "schemas": [{"name": "upload", "entities": []}],
-        }
-    ]
-}
-uploaded_landscape_graph = nx.MultiDiGraph()
 
-uploaded_dataset_map: dict[str, tuple[str, dict]] = {}
+# idtypes connecting more entities than this are kept as implicit hubs instead of
+# deriving all their pairwise 1-1 relations, unset derives every relation eagerly
+max_idtype_fanout: int | None = (
+    int(os.environ["MAX_IDTYPE_FANOUT"]) if "MAX_IDTYPE_FANOUT" in os.environ else None
+)
+
+# the landscape files of the data directory with their stats, the directory is only
+# scanned again when it changes
+landscape_catalog = LandscapeCatalog("data")
+
+# the parsed landscape files are reused while the files are unchanged, up to this
+# many bytes of files
+landscape_files = LandscapeFileCache(
+    int(os.environ.get("LANDSCAPE_FILE_CACHE_BYTES", str(256 * 2**20)))
+)
+
+# the graphs built from landscape files are kept in this directory across restarts,
+# relative to the backend directory, an empty value disables it. Graphs unused for
+# longer than the max age are deleted, then the least recently used ones beyond the
+# max bytes
+landscape_graph_cache_dir: str = os.environ.get(
+    "LANDSCAPE_GRAPH_CACHE_DIR", ".cache/landscape_graphs"
+)
+landscape_graph_cache: LandscapeGraphCache | None = (
+    LandscapeGraphCache(
+        os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), landscape_graph_cache_dir
+        ),
+        LANDSCAPE_GRAPH_VERSION,
+        max_bytes=int(os.environ.get("LANDSCAPE_GRAPH_CACHE_BYTES", str(2**30))),
+        max_age_seconds=float(
+            os.environ.get("LANDSCAPE_GRAPH_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600))
+        ),
+    )
+    if landscape_graph_cache_dir
+    else None
+)
+
+# the landscapes requested together are built in parallel by this many worker
+# processes, 0 and 1 build them in the process of the server
+landscape_build_processes: int = int(os.environ.get("LANDSCAPE_BUILD_PROCESSES", "0"))
+_build_executor: Executor | None = None
+_build_executor_lock = threading.Lock()
+
+# mutating routes answer clients knowing one of the last versions of the graph with
+# the delta since that version instead of the whole graph
+graph_changes_history_size: int = int(os.environ.get("GRAPH_CHANGES_HISTORY", "32"))
+
+
+def _get_empty_graph() -> LandscapeGraph:
+    return CompactLandscapeGraph() if compact_graph_storage else LandscapeGraph()
+
+
+def _get_empty_uploaded_landscape() -> dict:
+    return {
+        "databases": [
+            {
+                "id": "db",
+                "dbEngine": "postgresql",
+                "schemas": [{"name": "upload", "entities": []}],
+            }
+        ]
+    }
+
+
+@dataclass(frozen=True)
+class GraphSnapshot:
+    """
+    The graph and the landscapes it is merged from, at one version.
+
+    Snapshots and everything they hold are never mutated. Routes changing the graph
+    copy what they change under `_write_lock` and publish a new snapshot, routes
+    reading the graph use the snapshot published when they started, without locking.
+    """
+
+    version: int = 0
+    graph: nx.MultiDiGraph = field(
+        default_factory=lambda: nx.freeze(_get_empty_graph())
+    )
+    landscapes: dict[str, tuple[str, dict]] = field(default_factory=dict)
+    landscape_graphs: dict[str, nx.MultiDiGraph] = field(default_factory=dict)
+    uploaded_datasets: dict[str, tuple[str, dict]] = field(default_factory=dict)
+    uploaded_landscape: dict = field(default_factory=_get_empty_uploaded_landscape)
+    # the changes of the graph in the last versions, oldest first
+    changes: tuple[tuple[int, dict], ...] = ()
+
+
+_snapshot = GraphSnapshot()
+_write_lock = threading.Lock()
+
+# responses are cached for the version they were serialized at, the least recently
+# used are dropped beyond the cache size. The epoch keeps the ETags and versions of a
+# restarted server apart.
+_graph_epoch: str = uuid4().hex[:8]
+_response_cache: OrderedDict[tuple, bytes] = OrderedDict()
+_response_cache_size = int(os.environ.get("GRAPH_RESPONSE_CACHE_SIZE", "8"))
+_response_cache_lock = threading.Lock()
+
+# clients subscribed to /stream get the changes of each version pushed, clients
+# falling this many events behind are resynced with a snapshot of the graph
+graph_stream = GraphStream(int(os.environ.get("GRAPH_STREAM_BUFFER_SIZE", "16")))
+graph_stream_keepalive_seconds: float = 15.0
+
+# landscapes loaded by jobs are built in the background, requests for jobs beyond
+# the pending ones are refused until some have finished
+landscape_jobs = JobExecutor(
+    max_workers=int(os.environ.get("LANDSCAPE_JOBS_WORKERS", "2")),
+    max_pending=int(os.environ.get("LANDSCAPE_JOBS_MAX_PENDING", "8")),
+)
+
+# landscapes loaded by a job when the server starts, the server reports being ready
+# once they are published
+preload_landscape_names: list[str] = [
+    name for name in os.environ.get("PRELOAD_LANDSCAPES", "").split(",") if name
+]
+preload_job: Job | None = None
 
 _log = logging.getLogger(__name__)
 
 
+def _get_stored_graph(G_landscape: nx.MultiDiGraph) -> nx.MultiDiGraph:
+    return to_compact_graph(G_landscape) if compact_graph_storage else G_landscape
+
+
+def _get_build_executor() -> Executor:
+    global _build_executor
+    with _build_executor_lock:
+        if _build_executor is None:
+            # multiprocessing is only imported by servers building in processes
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # workers are spawned, forking would copy the threads of the server
+            _build_executor = ProcessPoolExecutor(
+                landscape_build_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _build_executor
+
+
+def _reset_build_executor() -> None:
+    global _build_executor
+    with _build_executor_lock:
+        if _build_executor is not None:
+            _build_executor.shutdown(wait=False, cancel_futures=True)
+        _build_executor = None
+
+
+def _get_recorded_results(results: Iterable[tuple]) -> Iterator:
+    # the stages run by workers are recorded in the metrics of the server
+    for result, stages in results:
+        record_stages(stages)
+        yield result
+
+
+def _build_landscapes(
+    landscape_jsons: dict[str, dict],
+    job: Job | None = None,
+    digests: dict[str, str] | None = None,
+) -> dict[str, nx.MultiDiGraph]:
+    """
+    Build the graphs of the landscapes. The graphs of landscapes with the digest of
+    their file are looked up in and added to `landscape_graph_cache`.
+    """
+    cache_keys, cached_graphs = {}, {}
+    if landscape_graph_cache is not None:
+        for name, digest in (digests or {}).items():
+            # the relation keys of the graphs depend on the relation hash scheme
+            cache_keys[name] = landscape_graph_cache.get_key(
+                digest, name, max_idtype_fanout, landscape_merge.RELATION_HASH_SCHEME
+            )
+            cached_graph = landscape_graph_cache.get(cache_keys[name])
+            if cached_graph is not None:
+                cached_graphs[name] = cached_graph
+
+    names = [name for name in landscape_jsons if name not in cached_graphs]
+    if landscape_build_processes > 1 and len(names) > 1:
+        # the built graphs are pickled back with their indexes, so they are merged
+        # without being indexed again, and with the stages the workers ran
+        graphs = _get_recorded_results(
+            _get_build_executor().map(
+                call_recording_stages,
+                repeat(build_landscape_graph),
+                [landscape_jsons[name] for name in names],
+                names,
+                repeat(max_idtype_fanout),
+            )
+        )
+    else:
+        graphs = (
+            build_landscape_graph(landscape_jsons[name], name, max_idtype_fanout)
+            for name in names
+        )
+
+    landscape_graphs = {}
+    try:
+        for name, landscape_graph in chain(cached_graphs.items(), zip(names, graphs)):
+            if name in cache_keys and name not in cached_graphs:
+                landscape_graph_cache.put(cache_keys[name], landscape_graph)
+            landscape_graphs[name] = _get_stored_graph(landscape_graph)
+            if job is not None:
+                job.advance("build")
+                job.check_cancelled()
+    except BrokenExecutor:
+        # a worker died, the next builds start a new pool
+        _reset_build_executor()
+        raise
+    return {name: landscape_graphs[name] for name in landscape_jsons}
+
+
+def _get_writable_graph(snapshot: GraphSnapshot) -> LandscapeGraph:
+    # copy on write, the copy records its changes for the delta of the next version
+    G = snapshot.graph.copy_on_write()
+    G.track_changes()
+    return G
+
+
+def _publish_snapshot(G: LandscapeGraph, **state) -> GraphSnapshot:
+    """
+    Publish G and the changed state as the next version of the graph. Callers hold
+    `_write_lock` from reading the snapshot they change until it is published.
+    """
+    global _snapshot
+    version = _snapshot.version + 1
+    changes = (*_snapshot.changes, (version, G.pop_changes()))
+    snapshot = replace(
+        _snapshot,
+        version=version,
+        graph=nx.freeze(G),
+        changes=changes[-graph_changes_history_size:],
+        **state,
+    )
+    _snapshot = snapshot
+    with _response_cache_lock:
+        _response_cache.clear()
+    graph_stream.publish(
+        version,
+        lambda: _get_stream_event(
+            snapshot,
+            "change",
+            delta=get_node_link_delta(snapshot.graph, snapshot.changes[-1][1]),
+        ),
+        lambda: _get_stream_event(
+            snapshot, "snapshot", graph=get_node_link_data(snapshot.graph)
+        ),
+    )
+    return snapshot
+
+
+def _get_json_response(data, headers: dict[str, str] | None = None) -> Response:
+    return Response(
+        content=get_json_bytes(data), media_type="application/json", headers=headers
+    )
+
+
+def _get_version_tag(version: int) -> str:
+    return f"{_graph_epoch}-{version}"
+
+
+def _get_stream_event(snapshot: GraphSnapshot, event: str, **content) -> bytes:
+    version = _get_version_tag(snapshot.version)
+    return format_event(version, event, get_json_bytes({"version": version, **content}))
+
+
+def _get_changes_since(snapshot: GraphSnapshot, since_version: str) -> dict | None:
+    epoch, _, version = since_version.rpartition("-")
+    if epoch != _graph_epoch or not version.isdigit():
+        return None
+    version = int(version)
+    oldest_version = (
+        snapshot.changes[0][0] if snapshot.changes else snapshot.version + 1
+    )
+    if version > snapshot.version or version < oldest_version - 1:
+        return None
+
+    changes = {}
+    for changes_version, version_changes in snapshot.changes:
+        if changes_version > version:
+            # keep the attributes from before the first change since the version
+            for element, attr in version_changes.items():
+                changes.setdefault(element, attr)
+    return changes
+
+
+def _get_graph_response(
+    snapshot: GraphSnapshot, since_version: str | None, **content
+) -> Response:
+    """
+    Respond with the whole graph, or with the delta since the version a client
+    knows. Clients whose version is no longer in the history get the whole graph.
+    """
+    G = snapshot.graph
+    version = _get_version_tag(snapshot.version)
+    headers = {"X-Graph-Version": version}
+    if since_version is None:
+        data = get_node_link_data(G)
+        return _get_json_response(
+            {**content, "graph": data} if content else data, headers
+        )
+
+    content["version"] = version
+    changes = _get_changes_since(snapshot, since_version)
+    if changes is None:
+        content["graph"] = get_node_link_data(G)
+    else:
+        content["delta"] = get_node_link_delta(G, changes)
+    return _get_json_response(content, headers)
+
+
+def _is_not_modified(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _get_cached_response(
+    snapshot: GraphSnapshot,
+    key: tuple,
+    if_none_match: str | None,
+    get_content: Callable[[nx.MultiDiGraph], object],
+) -> Response:
+    version = snapshot.version
+    key_digest = hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()
+    etag = f'"{_get_version_tag(version)}-{key_digest}"'
+    # clients revalidate on every request, unchanged graphs are answered with a 304
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "X-Graph-Version": _get_version_tag(version),
+    }
+    if _is_not_modified(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    cache_key = (version, *key)
+    with _response_cache_lock:
+        body = _response_cache.get(cache_key)
+        if body is not None:
+            _response_cache.move_to_end(cache_key)
+    if body is None:
+        body = get_json_bytes(get_content(snapshot.graph))
+        # responses of a snapshot replaced in the meantime are not kept
+        with _response_cache_lock:
+            if snapshot is _snapshot:
+                _response_cache[cache_key] = body
+                while len(_response_cache) > _response_cache_size:
+                    _response_cache.popitem(last=False)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @graph_router.post("/populate_graph")
 def populate_graph_route():
-    global G
     # Load landscape data from file
-    visyn_kb_json = json.load(open("data/visyn_kb.json"))
-    loaded_landscapes_map["visyn_kb"] = ("file", visyn_kb_json)
+    visyn_kb_json = landscape_files.load("data/visyn_kb.json")
     # Create the initial graph
-    visyn_kb_graph = populate_graph(visyn_kb_json, landscape_name="visyn_kb")
-    visyn_kb_graph = deduplicate_relations(visyn_kb_graph)
-    G = merge_graphs([G, visyn_kb_graph])
-    loaded_landscapes_graph_map["visyn_kb"] = visyn_kb_graph
-    data = json_graph.node_link_data(visyn_kb_graph)
-    return data
+    visyn_kb_graph = _get_stored_graph(
+        populate_graph(visyn_kb_json, landscape_name="visyn_kb")
+    )
+    with _write_lock:
+        snapshot = _snapshot
+        G = _get_writable_graph(snapshot)
+        add_landscape_to_graph(G, visyn_kb_graph)
+        _publish_snapshot(
+            G,
+            landscapes={**snapshot.landscapes, "visyn_kb": ("file", visyn_kb_json)},
+            landscape_graphs={**snapshot.landscape_graphs, "visyn_kb": visyn_kb_graph},
+        )
+    data = get_node_link_data(visyn_kb_graph)
+    return _get_json_response(data)
 
 
 @graph_router.post("/populate_idtype_relations")
 def populate_idtype_relations_route():
-    global G
-    if G is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Graph not initialized. Please populate the graph first.",
+    with _write_lock:
+        snapshot = _snapshot
+        visyn_kb_graph = snapshot.landscape_graphs.get("visyn_kb", LandscapeGraph())
+        visyn_kb_graph = populate_idtype_relations(
+            visyn_kb_graph,
+            landscape_name="visyn_kb",
+            max_idtype_fanout=max_idtype_fanout,
         )
-
-    visyn_kb_graph = loaded_landscapes_graph_map.get("visyn_kb", nx.MultiDiGraph())
-    visyn_kb_graph = populate_idtype_relations(
-        visyn_kb_graph, landscape_name="visyn_kb"
-    )
-    visyn_kb_graph = deduplicate_relations(visyn_kb_graph)
-    loaded_landscapes_graph_map["visyn_kb"] = visyn_kb_graph
-    G = merge_graphs([G, visyn_kb_graph])
-    data = json_graph.node_link_data(visyn_kb_graph)
-    return data
+        G = _get_writable_graph(snapshot)
+        add_landscape_to_graph(G, visyn_kb_graph)
+        _publish_snapshot(
+            G,
+            landscape_graphs={**snapshot.landscape_graphs, "visyn_kb": visyn_kb_graph},
+        )
+    data = get_node_link_data(visyn_kb_graph)
+    return _get_json_response(data)
 
 
 @graph_router.post("/populate_one_to_n_relations")
 def populate_one_to_n_relations_route():
-    global G
-    if G is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Graph not initialized. Please populate the graph first.",
-        )
-
-    _, visyn_kb_json = loaded_landscapes_map.get("visyn_kb", {})
-    visyn_kb_graph = loaded_landscapes_graph_map.get("visyn_kb", nx.MultiDiGraph())
+    with _write_lock:
+        snapshot = _snapshot
+        _, visyn_kb_json = snapshot.landscapes.get("visyn_kb", {})
+        visyn_kb_graph = snapshot.landscape_graphs.get("visyn_kb", LandscapeGraph())
 
-    visyn_kb_graph = populate_one_to_n_relations(
-        visyn_kb_graph, visyn_kb_json, landscape_name="visyn_kb"
-    )
-    visyn_kb_graph = deduplicate_relations(visyn_kb_graph)
-    loaded_landscapes_graph_map["visyn_kb"] = visyn_kb_graph
-    G = merge_graphs([G, visyn_kb_graph])
-    data = json_graph.node_link_data(visyn_kb_graph)
-    return data
+        visyn_kb_graph = populate_one_to_n_relations(
+            visyn_kb_graph, visyn_kb_json, landscape_name="visyn_kb"
+        )
+        G = _get_writable_graph(snapshot)
+        add_landscape_to_graph(G, visyn_kb_graph)
+        _publish_snapshot(
+            G,
+            landscape_graphs={**snapshot.landscape_graphs, "visyn_kb": visyn_kb_graph},
+        )
+    data = get_node_link_data(visyn_kb_graph)
+    return _get_json_response(data)
 
 
 @graph_router.post("/populate_ordino_drilldown_relations")
 def populate_ordino_drilldown_relations_route():
-    global G
-    if G is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Graph not initialized. Please populate the graph first.",
+    with _write_lock:
+        snapshot = _snapshot
+        _, visyn_kb_json = snapshot.landscapes.get("visyn_kb", {})
+        visyn_kb_graph = snapshot.landscape_graphs.get("visyn_kb", LandscapeGraph())
+        visyn_kb_graph = populate_ordino_drilldown_relations(
+            visyn_kb_graph, visyn_kb_json, landscape_name="visyn_kb"
         )
-
-    _, visyn_kb_json = loaded_landscapes_map.get("visyn_kb", {})
-    visyn_kb_graph = loaded_landscapes_graph_map.get("visyn_kb", nx.MultiDiGraph())
-    visyn_kb_graph = populate_ordino_drilldown_relations(
-        visyn_kb_graph, visyn_kb_json, landscape_name="visyn_kb"
-    )
-    visyn_kb_graph = deduplicate_relations(visyn_kb_graph)
-    loaded_landscapes_graph_map["visyn_kb"] = visyn_kb_graph
-    G = merge_graphs([G, visyn_kb_graph])
-    data = json_graph.node_link_data(G)
-    return data
+        G = _get_writable_graph(snapshot)
+        add_landscape_to_graph(G, visyn_kb_graph)
+        snapshot = _publish_snapshot(
+            G,
+            landscape_graphs={**snapshot.landscape_graphs, "visyn_kb": visyn_kb_graph},
+        )
+    data = get_node_link_data(snapshot.graph)
+    return _get_json_response(data)
 
 
 @graph_router.get("/get_graph")
-def get_graph_route(with_idtype_nodes: bool, remove_isolated_nodes: bool):
-    global G
-    if G is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Graph not initialized. Please populate the graph first.",
+def get_graph_route(
+    with_idtype_nodes: bool,
+    remove_isolated_nodes: bool,
+    expand_idtype_relations: bool = False,
+    origins: Annotated[list[str] | None, Query()] = None,
+    relation_types: Annotated[list[str] | None, Query()] = None,
+    if_none_match: str | None = Header(default=None),
+):
+    def get_graph_data(G: nx.MultiDiGraph) -> dict:
+        SG = expand_implicit_idtype_relations(G) if expand_idtype_relations else G
+        # the filters are views on the graph, only the serialized data is allocated
+        SG = get_filtered_graph(
+            SG,
+            hidden_node_types=[] if with_idtype_nodes else ["idtype"],
+            remove_isolated_nodes=remove_isolated_nodes,
+            origins=origins,
+            relation_types=relation_types,
         )
-
-    SG = G.copy()
-    SG = deduplicate_relations(SG)
-    SG = get_subgraph_with_idtype_nodes(SG, with_idtype_nodes)
-    SG = get_subgraph_with_isolated_nodes_removed(SG, remove_isolated_nodes)
-    data = json_graph.node_link_data(SG)
-
-    return data
+        return get_node_link_data(SG)
+
+    return _get_cached_response(
+        _snapshot,
+        (
+            "graph",
+            with_idtype_nodes,
+            remove_isolated_nodes,
+            expand_idtype_relations,
+            None if origins is None else tuple(sorted(origins)),
+            None if relation_types is None else tuple(sorted(relation_types)),
+        ),
+        if_none_match,
+        get_graph_data,
+    )
 
 
 @graph_router.get("/get_available_landscapes")
 def get_available_landscapes_route():
     # For simplicity, we assume the available landscapes are the JSON files in the data directory
-    import os
+    return [entry["name"] for entry in landscape_catalog.get_entries()]
 
-    data_dir = "data"
-    landscape_files = [
-        f[:-5] for f in os.listdir(data_dir) if f.endswith(".json")
-    ]  # Remove .json extension
-    return landscape_files
+
+@graph_router.get("/get_landscape_catalog")
+def get_landscape_catalog_route():
+    return landscape_catalog.get_entries()
 
 
 @graph_router.get("/get_loaded_landscapes")
 def get_loaded_landscapes_route():
     # For simplicity, we assume the available landscapes are the JSON files in the data directory
-    global loaded_landscapes_map
     return [
         {"name": name, "source": source}
-        for name, (source, _) in loaded_landscapes_map.items()
+        for name, (source, _) in _snapshot.landscapes.items()
     ]
 
 
+def _publish_landscapes(
+    landscapes: dict[str, tuple[str, dict]],
+    landscape_graphs: dict[str, nx.MultiDiGraph],
+    job: Job | None = None,
+) -> GraphSnapshot:
+    with _write_lock:
+        snapshot = _snapshot
+        G = _get_writable_graph(snapshot)
+        for landscape_graph in landscape_graphs.values():
+            if job is not None:
+                job.check_cancelled()
+            add_landscape_to_graph(G, landscape_graph)
+            if job is not None:
+                job.advance("merge")
+        return _publish_snapshot(
+            G,
+            landscapes={**snapshot.landscapes, **landscapes},
+            landscape_graphs={**snapshot.landscape_graphs, **landscape_graphs},
+        )
+
+
 @graph_router.post("/add_landscapes")
-def add_landscapes_route(landscape_names: list[str]):
-    global G
+def add_landscapes_route(landscape_names: list[str], since_version: str | None = None):
+    landscapes, digests = {}, {}
     for landscape_name in landscape_names:
         # Load landscape data from file
-        landscape_json = json.load(open(f"data/{landscape_name}.json"))
-        loaded_landscapes_map[landscape_name] = ("file", landscape_json)
-        # Create the initial graph
-        landscape_graph = populate_graph(landscape_json, landscape_name)
-        landscape_graph = populate_idtype_relations(landscape_graph, landscape_name)
-        landscape_graph = populate_one_to_n_relations(
-            landscape_graph, landscape_json, landscape_name
+        landscape_json, digests[landscape_name] = landscape_files.load_with_digest(
+            f"data/{landscape_name}.json"
         )
-        landscape_graph = populate_ordino_drilldown_relations(
-            landscape_graph, landscape_json, landscape_name
+        landscapes[landscape_name] = ("file", landscape_json)
+    # Create the graphs, landscapes are built without holding the write lock
+    landscape_graphs = _build_landscapes(
+        {name: landscape_json for name, (_, landscape_json) in landscapes.items()},
+        digests=digests,
+    )
+
+    snapshot = _publish_landscapes(landscapes, landscape_graphs)
+    return _get_graph_response(snapshot, since_version)
+
+
+def _run_add_landscapes_job(job: Job, landscape_names: list[str]) -> dict:
+    landscapes, digests = {}, {}
+    for landscape_name in landscape_names:
+        job.check_cancelled()
+        landscape_json, digests[landscape_name] = landscape_files.load_with_digest(
+            f"data/{landscape_name}.json"
         )
-        landscape_graph = deduplicate_relations(landscape_graph)
-        loaded_landscapes_graph_map[landscape_name] = landscape_graph
-        G = merge_graphs([G, landscape_graph])
+        landscapes[landscape_name] = ("file", landscape_json)
+        job.advance("load")
+
+    job.check_cancelled()
+    landscape_graphs = _build_landscapes(
+        {name: landscape_json for name, (_, landscape_json) in landscapes.items()},
+        job,
+        digests,
+    )
 
-    data = json_graph.node_link_data(G)
-    return data
+    # nothing is published before all landscapes are merged
+    snapshot = _publish_landscapes(landscapes, landscape_graphs, job)
+    return {"version": _get_version_tag(snapshot.version)}
 
 
-@graph_router.post("/add_custom_landscape")
-def add_custom_landscape_route(payload: dict):
-    global G
+def submit_add_landscapes_job(landscape_names: list[str]) -> Job:
+    stages = dict.fromkeys(["load", "build", "merge"], len(landscape_names))
+    return landscape_jobs.submit(
+        Job(stages), lambda job: _run_add_landscapes_job(job, landscape_names)
+    )
+
 
+def preload_landscapes() -> Job | None:
+    global preload_job
+    if preload_landscape_names:
+        preload_job = submit_add_landscapes_job(preload_landscape_names)
+    return preload_job
+
+
+def get_readiness() -> dict:
+    status = "ready"
+    if preload_job is not None and preload_job.status != "done":
+        status = "starting" if preload_job.finished_at is None else "failed"
+    return {
+        "status": status,
+        "version": _get_version_tag(_snapshot.version),
+        "preload": preload_job.to_dict() if preload_job is not None else None,
+    }
+
+
+def shutdown_landscape_builds() -> None:
+    if preload_job is not None:
+        preload_job.cancel()
+    _reset_build_executor()
+
+
+@graph_router.post("/jobs/add_landscapes", status_code=202)
+def add_landscapes_job_route(landscape_names: list[str]):
+    try:
+        job = submit_add_landscapes_job(landscape_names)
+    except JobQueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many landscape jobs, retry later ({e}).",
+            headers={"Retry-After": "1"},
+        ) from e
+    return job.to_dict()
+
+
+def _get_job(job_id: str) -> Job:
+    job = landscape_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+
+@graph_router.get("/jobs/{job_id}")
+def get_job_route(job_id: str):
+    return _get_job(job_id).to_dict()
+
+
+@graph_router.delete("/jobs/{job_id}")
+def cancel_job_route(job_id: str):
+    job = _get_job(job_id)
+    job.cancel()
+    return job.to_dict()
+
+
+def _get_profile_capture(capture_id: str) -> ProfileCapture:
+    if not request_profiler_enabled:
+        raise HTTPException(
+            status_code=403, detail="The profiler is disabled (GRAPH_PROFILER=1)."
+        )
+    capture = request_profiler.get(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail=f"Profile {capture_id} not found.")
+    return capture
+
+
+@graph_router.post("/profiles", status_code=201)
+def arm_profiler_route(route: str, requests: int = 1):
+    if not request_profiler_enabled:
+        raise HTTPException(
+            status_code=403, detail="The profiler is disabled (GRAPH_PROFILER=1)."
+        )
+    if not route.startswith(graph_router.prefix):
+        route = graph_router.prefix + route
+    if route not in request_profiler.routes:
+        raise HTTPException(status_code=404, detail=f"Route {route} not found.")
+    if requests < 1:
+        raise HTTPException(status_code=422, detail="At least 1 request is profiled.")
+    return request_profiler.arm(route, requests).to_dict()
+
+
+@graph_router.get("/profiles/{capture_id}")
+def get_profile_route(capture_id: str):
+    return _get_profile_capture(capture_id).to_dict()
+
+
+@graph_router.get("/profiles/{capture_id}/download")
+def download_profile_route(capture_id: str):
+    capture = _get_profile_capture(capture_id)
+    return Response(
+        capture.to_zip(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{capture.id}.zip"'
+        },
+    )
+
+
+@graph_router.delete("/profiles/{capture_id}")
+def disarm_profiler_route(capture_id: str):
+    capture = _get_profile_capture(capture_id)
+    request_profiler.disarm(capture)
+    return capture.to_dict()
+
+
+@graph_router.post("/add_custom_landscape")
+def add_custom_landscape_route(payload: dict, since_version: str | None = None):
     landscape_name: str = payload.get("name", "")
     data: str = payload.get("data", "{}")
 
     # Load landscape data from file
     landscape_json = json.loads(data)
-    loaded_landscapes_map[landscape_name] = ("db", landscape_json)
-    # Create the initial graph
-    landscape_graph = populate_graph(landscape_json, landscape_name)
-    landscape_graph = populate_idtype_relations(landscape_graph, landscape_name)
-    landscape_graph = populate_one_to_n_relations(
-        landscape_graph, landscape_json, landscape_name
-    )
-    landscape_graph = populate_ordino_drilldown_relations(
-        landscape_graph, landscape_json, landscape_name
+    # Create the graph
+    landscape_graph = _get_stored_graph(
+        build_landscape_graph(landscape_json, landscape_name, max_idtype_fanout)
     )
-    landscape_graph = deduplicate_relations(landscape_graph)
-    loaded_landscapes_graph_map[landscape_name] = landscape_graph
-    G = merge_graphs([G, landscape_graph])
-    data = json_graph.node_link_data(G)
-    return data
+    with _write_lock:
+        snapshot = _snapshot
+        G = _get_writable_graph(snapshot)
+        add_landscape_to_graph(G, landscape_graph)
+        snapshot = _publish_snapshot(
+            G,
+            landscapes={**snapshot.landscapes, landscape_name: ("db", landscape_json)},
+            landscape_graphs={
+                **snapshot.landscape_graphs,
+                landscape_name: landscape_graph,
+            },
+        )
+    return _get_graph_response(snapshot, since_version)
 
 
 @graph_router.delete("/remove_landscape")
-def remove_landscape_route(landscape_name: str):
-    global G
-
-    graphs_to_merge = [
-        Gl for name, Gl in loaded_landscapes_graph_map.items() if name != landscape_name
-    ]
+def remove_landscape_route(landscape_name: str, since_version: str | None = None):
+    with _write_lock:
+        snapshot = _snapshot
+        landscapes = {
+            name: landscape
+            for name, landscape in snapshot.landscapes.items()
+            if name != landscape_name
+        }
+        landscape_graphs = {
+            name: Gl
+            for name, Gl in snapshot.landscape_graphs.items()
+            if name != landscape_name
+        }
 
-    loaded_landscapes_map.pop(landscape_name, None)
-    loaded_landscapes_graph_map.pop(landscape_name, None)
+        G = _get_writable_graph(snapshot)
+        if len(landscape_graphs) != 0:
+            remove_landscape_from_graph(
+                G, landscape_name, list(landscape_graphs.values())
+            )
+        else:
+            G.clear()
+        snapshot = _publish_snapshot(
+            G, landscapes=landscapes, landscape_graphs=landscape_graphs
+        )
 
-    if len(graphs_to_merge) != 0:
-        G = merge_graphs(graphs_to_merge)
-        data = json_graph.node_link_data(G)
-        return data
-    else:
-        G = nx.MultiDiGraph()
+    if len(landscape_graphs) == 0 and since_version is None:
         return None
+    return _get_graph_response(snapshot, since_version)
 
 
-@graph_router.post("/add_real_uploaded_dataset")
-def add_real_uploaded_dataset_route():
-    global \
-        G, \
-        uploaded_landscape, \
-        uploaded_landscape_name, \
-        uploaded_landscape_graph, \
-        uploaded_dataset_map, \
-        loaded_landscapes_map, \
-        loaded_landscapes_graph_map
-
-    copied_uploaded_landscape = uploaded_landscape.copy()
-
-    dataset_id, uploaded_landscape = generate_landscape_with_real_uploaded_dataset(
-        G, copied_uploaded_landscape
-    )
-    uploaded_dataset_map[dataset_id] = ("real", uploaded_landscape)
+def _add_uploaded_dataset(
+    generate_landscape: Callable[[nx.MultiDiGraph, dict], tuple[str, dict]],
+    dataset_source: str,
+    since_version: str | None,
+) -> Response:
+    with _write_lock:
+        snapshot = _snapshot
+        copied_uploaded_landscape = snapshot.uploaded_landscape.copy()
 
-    # Load landscape data from file
-    loaded_landscapes_map[uploaded_landscape_name] = ("system", uploaded_landscape)
+        dataset_id, uploaded_landscape = generate_landscape(
+            snapshot.graph, copied_uploaded_landscape
+        )
 
-    # Create the initial graph
-    uploaded_landscape_graph = populate_graph(
-        uploaded_landscape, uploaded_landscape_name
-    )
-    G = merge_graphs([G, uploaded_landscape_graph])
-    uploaded_landscape_graph = populate_idtype_relations(G, uploaded_landscape_name)
-    # uploaded_landscape_graph = populate_one_to_n_relations(
-    #     G, uploaded_landscape, uploaded_landscape_name
-    # )
-    # uploaded_landscape_graph = populate_ordino_drilldown_relations(
-    #     G, uploaded_landscape, uploaded_landscape_name
-    # )
-    uploaded_landscape_graph = deduplicate_relations(uploaded_landscape_graph)
-    loaded_landscapes_graph_map[uploaded_landscape_name] = uploaded_landscape_graph
-    G = merge_graphs([G, uploaded_landscape_graph])
-    data = json_graph.node_link_data(G)
-    return {"datasetId": dataset_id, "graph": data}
+        # Create the initial graph
+        uploaded_landscape_graph = _get_stored_graph(
+            populate_graph(uploaded_landscape, uploaded_landscape_name)
+        )
+        # the idtype relations of the uploaded datasets are derived against the
+        # entities of all loaded landscapes
+        G = _get_writable_graph(snapshot)
+        add_uploaded_landscape_to_graph(
+            G, uploaded_landscape_graph, uploaded_landscape_name, max_idtype_fanout
+        )
+        # uploaded_landscape_graph = populate_one_to_n_relations(
+        #     G, uploaded_landscape, uploaded_landscape_name
+        # )
+        # uploaded_landscape_graph = populate_ordino_drilldown_relations(
+        #     G, uploaded_landscape, uploaded_landscape_name
+        # )
+        snapshot = _publish_snapshot(
+            G,
+            landscapes={
+                **snapshot.landscapes,
+                uploaded_landscape_name: ("system", uploaded_landscape),
+            },
+            landscape_graphs={
+                **snapshot.landscape_graphs,
+                uploaded_landscape_name: uploaded_landscape_graph,
+            },
+            uploaded_datasets={
+                **snapshot.uploaded_datasets,
+                dataset_id: (dataset_source, uploaded_landscape),
+            },
+            uploaded_landscape=uploaded_landscape,
+        )
+    return _get_graph_response(snapshot, since_version, datasetId=dataset_id)
 
 
-@graph_router.post("/add_random_uploaded_dataset")
-def add_random_uploaded_dataset_route():
-    global \
-        G, \
-        uploaded_landscape, \
-        uploaded_landscape_name, \
-        uploaded_landscape_graph, \
-        uploaded_dataset_map, \
-        loaded_landscapes_map, \
-        loaded_landscapes_graph_map
-
-    copied_uploaded_landscape = uploaded_landscape.copy()
-
-    dataset_id, uploaded_landscape = generate_landscape_with_random_uploaded_dataset(
-        G, copied_uploaded_landscape
+@graph_router.post("/add_real_uploaded_dataset")
+def add_real_uploaded_dataset_route(since_version: str | None = None):
+    return _add_uploaded_dataset(
+        generate_landscape_with_real_uploaded_dataset, "real", since_version
     )
-    uploaded_dataset_map[dataset_id] = ("random", uploaded_landscape)
 
-    # Load landscape data from file
-    loaded_landscapes_map[uploaded_landscape_name] = ("system", uploaded_landscape)
 
-    # Create the initial graph
-    uploaded_landscape_graph = populate_graph(
-        uploaded_landscape, uploaded_landscape_name
+@graph_router.post("/add_random_uploaded_dataset")
+def add_random_uploaded_dataset_route(since_version: str | None = None):
+    return _add_uploaded_dataset(
+        generate_landscape_with_random_uploaded_dataset, "random", since_version
     )
-    G = merge_graphs([G, uploaded_landscape_graph])
-    uploaded_landscape_graph = populate_idtype_relations(G, uploaded_landscape_name)
-    # uploaded_landscape_graph = populate_one_to_n_relations(
-    #     G, uploaded_landscape, uploaded_landscape_name
-    # )
-    # uploaded_landscape_graph = populate_ordino_drilldown_relations(
-    #     G, uploaded_landscape, uploaded_landscape_name
-    # )
-    # uploaded_landscape_graph = deduplicate_relations(uploaded_landscape_graph)
-    loaded_landscapes_graph_map[uploaded_landscape_name] = uploaded_landscape_graph
-    G = merge_graphs([G, uploaded_landscape_graph])
-    data = json_graph.node_link_data(G)
-    return {"datasetId": dataset_id, "graph": data}
 
 
 @graph_router.get("/get_uploaded_datasets")
 def get_uploaded_datasets_route():
     # For simplicity, we assume the available landscapes are the JSON files in the data directory
-    global uploaded_dataset_map
-    return list(uploaded_dataset_map.keys())
+    return list(_snapshot.uploaded_datasets.keys())
 
 
 @graph_router.delete("/remove_uploaded_dataset")
-def remove_uploaded_dataset_route(dataset_id: str):
-    global G
-
-    uploaded_dataset_map.pop(dataset_id, None)
-    uploaded_landscape_graph = loaded_landscapes_graph_map.get(
-        "uploaded_dataset", nx.MultiDiGraph()
-    )
-    uploaded_landscape_graph = remove_uploaded_dataset_from_graph(
-        uploaded_landscape_graph, dataset_id
-    )
-    loaded_landscapes_graph_map["uploaded_dataset"] = uploaded_landscape_graph
-    G = merge_graphs(
-        [
-            Gl
-            for name, Gl in loaded_landscapes_graph_map.items()
-            if name != "uploaded_dataset"
-        ]
-        + [uploaded_landscape_graph]
-    )
-    data = json_graph.node_link_data(G)
-    return data
+def remove_uploaded_dataset_route(dataset_id: str, since_version: str | None = None):
+    with _write_lock:
+        snapshot = _snapshot
+        uploaded_datasets = {
+            name: dataset
+            for name, dataset in snapshot.uploaded_datasets.items()
+            if name != dataset_id
+        }
+        uploaded_landscape_graph = snapshot.landscape_graphs.get(
+            uploaded_landscape_name, LandscapeGraph()
+        )
+        uploaded_landscape_graph = remove_uploaded_dataset_from_graph(
+            uploaded_landscape_graph, dataset_id
+        )
+        landscape_graphs = {
+            **snapshot.landscape_graphs,
+            uploaded_landscape_name: uploaded_landscape_graph,
+        }
+        # rebuild the contribution of the uploaded datasets without the removed one
+        G = _get_writable_graph(snapshot)
+        remove_landscape_from_graph(
+            G,
+            uploaded_landscape_name,
+            [
+                Gl
+                for name, Gl in landscape_graphs.items()
+                if name != uploaded_landscape_name
+            ],
+        )
+        add_uploaded_landscape_to_graph(
+            G, uploaded_landscape_graph, uploaded_landscape_name, max_idtype_fanout
+        )
+        snapshot = _publish_snapshot(
+            G, landscape_graphs=landscape_graphs, uploaded_datasets=uploaded_datasets
+        )
+    return _get_graph_response(snapshot, since_version)
 
 
 @graph_router.post("/reset_graph")
 def reset_graph():
-    global \
-        G, \
-        loaded_landscapes_graph_map, \
-        loaded_landscapes_map, \
-        uploaded_dataset_map, \
-        uploaded_landscape_graph, \
-        uploaded_landscape_name, \
-        uploaded_landscape
-    if G is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Graph not initialized. Please populate the graph first.",
+    with _write_lock:
+        # the graph is cleared instead of replaced to record the removed elements
+        G = _get_writable_graph(_snapshot)
+        G.clear()
+        _publish_snapshot(
+            G,
+            landscapes={},
+            landscape_graphs={},
+            uploaded_datasets={},
+            uploaded_landscape=_get_empty_uploaded_landscape(),
         )
-
-    G.clear()
-    loaded_landscapes_map.clear()
-    loaded_landscapes_graph_map.clear()
-    uploaded_dataset_map.clear()
-    uploaded_landscape = {
-        "databases": [
-            {
-                "id": "db",
-                "dbEngine": "postgresql",
-                "schemas": [{"name": "upload", "entities": []}],
-            }
-        ]
-    }
-    uploaded_landscape_graph = nx.MultiDiGraph()
     return None
 
 
 @graph_router.get("/get_relations/{node_id}")
 def get_relations_route(node_id: str):
-    global G
-    if G is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Graph not initialized. Please populate the graph first.",
-        )
-
-    relations = get_relations_for_node(G, node_id)
+    relations = get_relations_for_node(_snapshot.graph, node_id)
     return relations
 
 
-@graph_router.get("/get_flattened_landscape")
-def get_flattened_landscape_route():
-    global G
-    if G is None:
-        raise HTTPException(
-            status_code=400,
-            detail="Graph not initialized. Please populate the graph first.",
+def _get_stream_start_event(last_event_id: str | None) -> tuple[int, bytes]:
+    snapshot = _snapshot
+    changes = _get_changes_since(snapshot, last_event_id) if last_event_id else None
+    if changes is None:
+        return snapshot.version, _get_stream_event(
+            snapshot, "snapshot", graph=get_node_link_data(snapshot.graph)
         )
+    return snapshot.version, _get_stream_event(
+        snapshot, "change", delta=get_node_link_delta(snapshot.graph, changes)
+    )
+
+
+def _build_stream_events(get_events: list[Callable[[], bytes]]) -> bytes:
+    return b"".join(get_event() for get_event in get_events)
 
-    landscape = get_flattened_landscape(G)
-    return landscape
+
+@graph_router.get("/stream")
+async def stream_route(last_event_id: str | None = Header(default=None)):
+    # subscribe before the first event is built to not miss a version in between,
+    # events of the versions it already covers are skipped
+    subscriber = graph_stream.subscribe()
+    version, start_event = await run_in_threadpool(
+        _get_stream_start_event, last_event_id
+    )
+
+    async def get_events():
+        try:
+            yield start_event
+            while True:
+                events = await subscriber.get_events(graph_stream_keepalive_seconds)
+                events = [get_event for v, get_event in events if v > version]
+                if not events:
+                    yield b": keepalive\n\n"
+                    continue
+                # the events are serialized here, outside of the write lock
+                yield await run_in_threadpool(_build_stream_events, events)
+        finally:
+            graph_stream.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        get_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@graph_router.get("/get_memory_usage")
+def get_memory_usage_route(top: int = 10, sample_size: int = 256):
+    # the published snapshot does not change while it is walked
+    snapshot = _snapshot
+    return {
+        "version": _get_version_tag(snapshot.version),
+        **get_memory_usage(
+            snapshot.landscapes,
+            snapshot.landscape_graphs,
+            snapshot.graph,
+            top=top,
+            sample_size=sample_size,
+        ),
+    }
+
+
+@graph_router.get("/get_flattened_landscape")
+def get_flattened_landscape_route(
+    if_none_match: str | None = Header(default=None),
+):
+    return _get_cached_response(
+        _snapshot, ("flattened_landscape",), if_none_match, get_flattened_landscape
+    )
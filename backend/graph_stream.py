@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Callable
+
+
+def format_event(event_id: str, event: str, data: bytes) -> bytes:
+    # the data is compact JSON, it never spans more than one line
+    return f"id: {event_id}\nevent: {event}\ndata: ".encode() + data + b"\n\n"
+
+
+def _once(func: Callable[[], bytes]) -> Callable[[], bytes]:
+    # the events are built by the first client to read them, the others wait for it
+    lock = threading.Lock()
+    result: list[bytes] = []
+
+    def get_result() -> bytes:
+        with lock:
+            if not result:
+                result.append(func())
+            return result[0]
+
+    return get_result
+
+
+class GraphSubscriber:
+    """
+    Bounded buffer of the server-sent events of one client. The events are built
+    when the client reads them, not by the routes publishing the changes.
+
+    A client which does not keep up with the changes of the graph has its buffered
+    events replaced with a snapshot of the graph to resync from.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffer_size: int):
+        self._loop = loop
+        self._buffer_size = buffer_size
+        self._events: deque[tuple[int, Callable[[], bytes]]] = deque()
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+
+    def push(
+        self,
+        version: int,
+        get_event: Callable[[], bytes],
+        get_snapshot_event: Callable[[], bytes],
+    ) -> None:
+        with self._lock:
+            if len(self._events) >= self._buffer_size:
+                self._events.clear()
+                self._events.append((version, get_snapshot_event))
+            else:
+                self._events.append((version, get_event))
+        # events are pushed from the threads of the mutating routes
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def get_events(self, timeout: float) -> list[tuple[int, Callable[[], bytes]]]:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except TimeoutError:
+            return []
+        with self._lock:
+            self._ready.clear()
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+
+class GraphStream:
+    """
+    Publishes the events of each graph version to the subscribed clients. The
+    events are only built if a client reads them, and once for all of them.
+    """
+
+    def __init__(self, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._subscribers: set[GraphSubscriber] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> GraphSubscriber:
+        subscriber = GraphSubscriber(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: GraphSubscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(
+        self,
+        version: int,
+        get_event: Callable[[], bytes],
+        get_snapshot_event: Callable[[], bytes],
+    ) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+
+        get_event, get_snapshot_event = _once(get_event), _once(get_snapshot_event)
+        for subscriber in subscribers:
+            subscriber.push(version, get_event, get_snapshot_event)
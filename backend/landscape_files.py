@@ -0,0 +1,235 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import BinaryIO
+
+from graph_metrics import instrument_stage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+_log = logging.getLogger(__name__)
+
+
+def _parse_landscape_data(data: bytes | mmap.mmap) -> dict:
+    if orjson is not None:
+        with memoryview(data) as view:
+            try:
+                return orjson.loads(view)
+            except orjson.JSONDecodeError:
+                # json also parses integers which do not fit in 64 bits
+                pass
+    return json.loads(data[:])
+
+
+@instrument_stage
+def load_landscape_file(path: str) -> tuple[dict, str]:
+    """
+    Parse a landscape file, returns the document and the digest of the file.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return json.load(f), hashlib.blake2b().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _parse_landscape_data(data), hashlib.blake2b(data).hexdigest()
+
+
+def _get_landscape_stats(document: dict) -> dict:
+    databases = document.get("databases", [])
+    return {
+        "databases": len(databases),
+        "entities": sum(
+            len(schema.get("entities", []))
+            for db in databases
+            for schema in db.get("schemas", [])
+        ),
+        "idtypes": len(document.get("idtypes", [])),
+        "relations": dict(
+            Counter(r["type"] for r in document.get("relations", []) if "type" in r)
+        ),
+    }
+
+
+class _DigestReader:
+    """
+    A file whose chunks are hashed as they are read.
+    """
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+        self.hash = hashlib.blake2b()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._f.read(size)
+        self.hash.update(chunk)
+        return chunk
+
+
+def _stream_landscape_stats(f: BinaryIO) -> dict:
+    databases, entities, idtypes, relations = 0, 0, 0, Counter()
+    try:
+        for prefix, event, value in ijson.parse(f):
+            if event == "start_map":
+                if prefix == "databases.item":
+                    databases += 1
+                elif prefix == "databases.item.schemas.item.entities.item":
+                    entities += 1
+                elif prefix == "idtypes.item":
+                    idtypes += 1
+            elif prefix == "relations.item.type":
+                relations[value] += 1
+    except ijson.JSONError as e:
+        # like the errors of json
+        raise ValueError(f"Invalid JSON: {e}") from e
+    return {
+        "databases": databases,
+        "entities": entities,
+        "idtypes": idtypes,
+        "relations": dict(relations),
+    }
+
+
+def get_landscape_file_stats(path: str) -> tuple[dict | None, str]:
+    """
+    Count the databases, entities, idtypes and relations by type of a landscape
+    file, None if it is no valid JSON, and hash it in the same pass. The file is
+    streamed if ijson is installed, and parsed otherwise.
+    """
+    _log.debug(
+        "Hashing the landscape file %s %s",
+        path,
+        "while streaming it with ijson" if ijson is not None else "after parsing it",
+    )
+    with open(path, "rb") as f:
+        reader = _DigestReader(f)
+        try:
+            if ijson is not None:
+                stats = _stream_landscape_stats(reader)
+            else:
+                stats = _get_landscape_stats(_parse_landscape_data(reader.read()))
+        except ValueError:
+            _log.warning("Could not read the landscape file %s", path, exc_info=True)
+            stats = None
+        # the rest of an invalid file is hashed too
+        while reader.read(1 << 16):
+            pass
+    return stats, reader.hash.hexdigest()
+
+
+class LandscapeFileCache:
+    """
+    Parsed landscape files, reused as long as their file keeps the same
+    modification time and size. The least recently used documents are evicted once
+    their files add up to more than `max_bytes`.
+
+    The documents are shared by all loads of a file, they must not be mutated.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._documents: OrderedDict[str, tuple[tuple, dict, str]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_identity(stat: os.stat_result) -> tuple[int, int, int]:
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def load(self, path: str) -> dict:
+        return self.load_with_digest(path)[0]
+
+    def load_with_digest(self, path: str) -> tuple[dict, str]:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        identity = self._get_identity(stat)
+        with self._lock:
+            cached = self._documents.get(path)
+            if cached is not None and cached[0] == identity:
+                self._documents.move_to_end(path)
+                return cached[1], cached[2]
+
+        document, digest = load_landscape_file(path)
+        with self._lock:
+            self._evict(path)
+            if stat.st_size <= self.max_bytes:
+                self._documents[path] = (identity, document, digest)
+                self._size += stat.st_size
+            while self._size > self.max_bytes:
+                self._evict(next(iter(self._documents)))
+        return document, digest
+
+    def _evict(self, path: str) -> None:
+        cached = self._documents.pop(path, None)
+        if cached is not None:
+            self._size -= cached[0][2]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._documents.clear()
+            self._size = 0
+
+
+class LandscapeCatalog:
+    """
+    The landscape files of a directory, with their size, digest and stats. The
+    directory is listed again for each lookup, only the files whose modification
+    time or size changed are read again.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._entries: dict[str, tuple[tuple, dict]] = {}
+        self._lock = threading.Lock()
+        _log.info(
+            "Landscape files in %s are %s to be hashed",
+            directory,
+            "streamed with ijson" if ijson is not None else "parsed, ijson is missing",
+        )
+
+    def get_entries(self) -> list[dict]:
+        # files rewritten in place do not change the modification time of the
+        # directory, the files are checked each time
+        with self._lock:
+            self._scan()
+            return [entry for _, entry in self._entries.values()]
+
+    def _scan(self) -> None:
+        entries = {}
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            cached = self._entries.get(file_name)
+            if cached is not None and cached[0] == identity:
+                entries[file_name] = cached
+            else:
+                entries[file_name] = (identity, self._read_entry(path, stat))
+        self._entries = entries
+
+    @staticmethod
+    def _read_entry(path: str, stat: os.stat_result) -> dict:
+        stats, digest = get_landscape_file_stats(path)
+        return {
+            # Remove .json extension
+            "name": os.path.basename(path)[:-5],
+            "size": stat.st_size,
+            "modified": stat.st_mtime,
+            "digest": digest,
+            "stats": stats,
+        }
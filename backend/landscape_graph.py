@@ -0,0 +1,684 @@
+import sys
+import threading
+import weakref
+from collections.abc import Mapping
+from functools import cached_property
+
+import networkx as nx
+from networkx.exception import NetworkXError
+
+
+def get_relation_class(data: dict) -> tuple[str, int] | None:
+    # 1-n relations and idtype derived 1-1 relations share one uniqueness class per
+    # (source, target). The lower precedence wins: a 1-n relation replaces a derived
+    # 1-1 relation, within the same precedence the first relation is kept.
+    if data.get("type") == "1-n":
+        return "entity-relation", 0
+    if data.get("type") == "1-1" and data.get("via_idtype") is not None:
+        return "entity-relation", 1
+    return None
+
+
+def _get_node_index_keys(data: dict) -> list[tuple]:
+    keys = [("origin", origin) for origin in data.get("origins", [])]
+    if data.get("type") is not None:
+        keys.append(("type", data.get("type")))
+    if data.get("isUploaded", False):
+        keys.append(("uploaded", True))
+    return keys
+
+
+def _get_edge_index_keys(data: dict) -> list[tuple]:
+    keys = [("origin", origin) for origin in data.get("origins", [])]
+    if data.get("type") is not None:
+        keys.append(("type", data.get("type")))
+    keys.append(("derived", bool(data.get("is_derived", False))))
+    return keys
+
+
+class LandscapeGraph(nx.MultiDiGraph):
+    """
+    MultiDiGraph of a landscape which keeps its relations unique as they are
+    inserted, so the graph never has to be deduplicated before it is read.
+
+    Duplicated relations are merged into the relation kept in the graph, their
+    origins are added to the origins of the kept relation. Relations superseded by a
+    relation of higher precedence are dropped.
+
+    The graph also indexes its nodes by type, origin and upload, and its edges by
+    relation type, origin and derivation, so filtering them costs in proportion to
+    the result. Lookups return nodes and edges in the order of `G.nodes` and
+    `G.edges`. Nodes and edges have to be inserted with the add_* methods to be
+    indexed, data mutated in place is not re-indexed.
+
+    Once `track_changes` is called, the graph records the nodes and relations it
+    changes along with their attributes before the change, see `pop_changes`.
+
+    A graph created by `copy_on_write` shares the dicts of its nodes, adjacency and
+    indexes with the graph it was copied from, and copies them when it first changes
+    them.
+    """
+
+    def __init__(self, incoming_graph_data=None, multigraph_input=None, **attr):
+        self._relation_index: dict[tuple[str, str, str], str] = {}
+        self._node_index: dict[tuple, dict[str, None]] = {}
+        self._edge_index: dict[tuple, dict[tuple[str, str, str], None]] = {}
+        # creation order of the nodes, to return lookups in the order of the graph
+        self._node_order: dict[str, int] = {}
+        self._node_counter = 0
+        # attributes of the changed nodes and edges before their first change, None
+        # for added ones. Only recorded once track_changes is called.
+        self._changes: dict[tuple, dict | None] | None = None
+        # the dicts this graph copied or created since it was copied on write, None
+        # if it owns all of its dicts
+        self._owned: set[tuple] | None = None
+        super().__init__(incoming_graph_data, multigraph_input, **attr)
+
+    def _get_stored_data(self, data: Mapping) -> Mapping:
+        return data
+
+    def _record_change(self, element: tuple, attr: dict | None) -> None:
+        # every change unindexes the changed element first, so an element indexed
+        # before it was recorded did not exist before
+        if self._changes is not None and element not in self._changes:
+            self._changes[element] = None if attr is None else dict(attr)
+
+    def track_changes(self) -> None:
+        self._changes = {}
+
+    def pop_changes(self) -> dict[tuple, dict | None]:
+        """
+        Return the nodes ("node", n) and edges ("edge", u, v, key) changed since
+        the last call with their attributes before the change, None if they were
+        added, and start recording anew.
+        """
+        changes, self._changes = self._changes, {}
+        return changes or {}
+
+    def _own(self, owned_key: tuple, container: dict, key) -> None:
+        # copy the dict container[key] if it is shared with the graph copied from
+        if (
+            self._owned is not None
+            and owned_key not in self._owned
+            and key in container
+        ):
+            container[key] = container[key].copy()
+            self._owned.add(owned_key)
+
+    def _own_node(self, n) -> None:
+        self._own(("node", n), self._node, n)
+
+    def _own_adjacency(self, u, v) -> None:
+        # the dicts changed by adding or removing the relations from u to v
+        if self._owned is None:
+            return
+        self._own(("succ", u), self._succ, u)
+        self._own(("pred", v), self._pred, v)
+        if ("keys", u, v) not in self._owned and v in self._succ.get(u, {}):
+            # the key dict is shared by the successors and predecessors
+            self._succ[u][v] = self._pred[v][u] = self._succ[u][v].copy()
+            self._owned.add(("keys", u, v))
+
+    def _own_edge(self, u, v, key) -> None:
+        self._own_adjacency(u, v)
+        if u in self._succ and v in self._succ[u]:
+            self._own(("edge", u, v, key), self._succ[u][v], key)
+
+    def _own_neighbors(self, n) -> None:
+        # the dicts changed by removing the node n
+        if self._owned is None:
+            return
+        for v in self._succ.get(n, {}):
+            self._own(("pred", v), self._pred, v)
+        for u in self._pred.get(n, {}):
+            self._own(("succ", u), self._succ, u)
+
+    def _set_owned(self, *owned_keys: tuple) -> None:
+        if self._owned is not None:
+            self._owned.update(owned_keys)
+
+    def _get_index_entries(self, index: dict, kind: str, index_key: tuple) -> dict:
+        self._own((kind, index_key), index, index_key)
+        entries = index.get(index_key)
+        if entries is None:
+            entries = index[index_key] = {}
+            self._set_owned((kind, index_key))
+        return entries
+
+    def _index_node(self, n) -> None:
+        self._record_change(("node", n), None)
+        if n not in self._node_order:
+            self._node_order[n] = self._node_counter
+            self._node_counter += 1
+        for index_key in _get_node_index_keys(self._node[n].get("data", {})):
+            self._get_index_entries(self._node_index, "node_index", index_key)[n] = None
+
+    def _unindex_node(self, n) -> None:
+        self._record_change(("node", n), self._node[n])
+        for index_key in _get_node_index_keys(self._node[n].get("data", {})):
+            if index_key not in self._node_index:
+                continue
+            nodes = self._get_index_entries(self._node_index, "node_index", index_key)
+            nodes.pop(n, None)
+            if not nodes:
+                del self._node_index[index_key]
+
+    def _index_edge(self, u, v, key) -> None:
+        self._record_change(("edge", u, v, key), None)
+        data = self._adj[u][v][key].get("data", {})
+        # one edge tuple shared by all indexes of the edge
+        edge = (u, v, key)
+        for index_key in _get_edge_index_keys(data):
+            self._get_index_entries(self._edge_index, "edge_index", index_key)[edge] = (
+                None
+            )
+
+    def _unindex_edge(self, u, v, key) -> None:
+        self._record_change(("edge", u, v, key), self._adj[u][v][key])
+        data = self._adj[u][v][key].get("data", {})
+        for index_key in _get_edge_index_keys(data):
+            if index_key not in self._edge_index:
+                continue
+            edges = self._get_index_entries(self._edge_index, "edge_index", index_key)
+            edges.pop((u, v, key), None)
+            if not edges:
+                del self._edge_index[index_key]
+        relation_class = get_relation_class(data)
+        if (
+            relation_class is not None
+            and self._relation_index.get((u, v, relation_class[0])) == key
+        ):
+            del self._relation_index[(u, v, relation_class[0])]
+
+    def _unindex_node_and_edges(self, n) -> None:
+        for u, v, key in [
+            *self.out_edges(n, keys=True),
+            *self.in_edges(n, keys=True),
+        ]:
+            self._unindex_edge(u, v, key)
+        self._unindex_node(n)
+        self._node_order.pop(n, None)
+
+    def _lookup_nodes(self, index_key: tuple) -> list[str]:
+        graph = self.__dict__.get("_graph")
+        if graph is not None:
+            # subgraph views share the indexes of the graph they are filtering
+            return [n for n in graph._lookup_nodes(index_key) if n in self._node]
+        return sorted(
+            self._node_index.get(index_key, {}), key=self._node_order.__getitem__
+        )
+
+    def _lookup_edges(self, index_key: tuple) -> list[tuple[str, str, str]]:
+        graph = self.__dict__.get("_graph")
+        if graph is not None:
+            return [e for e in graph._lookup_edges(index_key) if self.has_edge(*e)]
+
+        edges_by_source: dict[str, set[tuple[str, str]]] = {}
+        for u, v, key in self._edge_index.get(index_key, {}):
+            edges_by_source.setdefault(u, set()).add((v, key))
+        # only walk the adjacency of the matching sources to keep the edge order
+        edges = []
+        for u in sorted(edges_by_source, key=self._node_order.__getitem__):
+            targets = edges_by_source[u]
+            for v, keydict in self._adj[u].items():
+                for key in keydict:
+                    if (v, key) in targets:
+                        edges.append((u, v, key))
+        return edges
+
+    def nodes_of_type(self, node_type: str) -> list[str]:
+        return self._lookup_nodes(("type", node_type))
+
+    def nodes_of_origin(self, origin: str) -> list[str]:
+        return self._lookup_nodes(("origin", origin))
+
+    def uploaded_nodes(self) -> list[str]:
+        return self._lookup_nodes(("uploaded", True))
+
+    def edges_of_type(self, relation_type: str) -> list[tuple[str, str, str]]:
+        return self._lookup_edges(("type", relation_type))
+
+    def edges_of_origin(self, origin: str) -> list[tuple[str, str, str]]:
+        return self._lookup_edges(("origin", origin))
+
+    def derived_edges(self, is_derived: bool = True) -> list[tuple[str, str, str]]:
+        return self._lookup_edges(("derived", is_derived))
+
+    def __getstate__(self):
+        # views cached on access are recreated after unpickling, changes recorded on
+        # the graph stay with it
+        cls = type(self)
+        state = {
+            k: v
+            for k, v in self.__dict__.items()
+            if not isinstance(getattr(cls, k, None), cached_property)
+        }
+        state["__networkx_cache__"] = {}
+        state["_changes"] = None
+        # the unpickled graph owns all of its dicts
+        state["_owned"] = None
+        return state
+
+    def copy(self, as_view=False):
+        if as_view or "_graph" in self.__dict__:
+            return super().copy(as_view)
+
+        # the relations of the graph are unique already, copy its structure and
+        # indexes instead of inserting every relation anew. Data is shared, it is
+        # replaced and never mutated in place.
+        G = self.__class__()
+        G.graph.update(self.graph)
+        G._node.update((n, attr.copy()) for n, attr in self._node.items())
+        G._succ.update(
+            (
+                u,
+                {
+                    v: {k: attr.copy() for k, attr in kd.items()}
+                    for v, kd in nbrs.items()
+                },
+            )
+            for u, nbrs in self._succ.items()
+        )
+        # successors and predecessors share the key dicts of their edges
+        G._pred.update(
+            (v, {u: G._succ[u][v] for u in nbrs}) for v, nbrs in self._pred.items()
+        )
+        G._relation_index = self._relation_index.copy()
+        G._node_index = {key: nodes.copy() for key, nodes in self._node_index.items()}
+        G._edge_index = {key: edges.copy() for key, edges in self._edge_index.items()}
+        G._node_order = self._node_order.copy()
+        G._node_counter = self._node_counter
+        return G
+
+    def copy_on_write(self) -> "LandscapeGraph":
+        """
+        A copy sharing the dicts of the nodes, relations and indexes of the graph,
+        which are copied when the copy first changes them. Only the outer dicts are
+        copied up front, so changing the copy costs in proportion to the change.
+
+        The graph must not change anymore once it is copied on write, like the
+        frozen graphs of the snapshots.
+        """
+        G = self.__class__()
+        G.graph.update(self.graph)
+        G._node.update(self._node)
+        G._succ.update(self._succ)
+        G._pred.update(self._pred)
+        G._relation_index = self._relation_index.copy()
+        G._node_index = self._node_index.copy()
+        G._edge_index = self._edge_index.copy()
+        G._node_order = self._node_order.copy()
+        G._node_counter = self._node_counter
+        G._owned = set()
+        return G
+
+    def add_node(self, node_for_adding, **attr):
+        n = node_for_adding
+        if n in self._node:
+            self._unindex_node(n)
+            self._own_node(n)
+        else:
+            self._set_owned(("node", n), ("succ", n), ("pred", n))
+        super().add_node(n, **attr)
+        self._index_node(n)
+
+    def replace_node(self, n, **attr) -> None:
+        # add_node updates the attributes of an existing node, this replaces them
+        self._unindex_node(n)
+        self._node[n] = self.node_attr_dict_factory()
+        self._set_owned(("node", n))
+        self.add_node(n, **attr)
+
+    def add_nodes_from(self, nodes_for_adding, **attr):
+        for n in nodes_for_adding:
+            try:
+                hash(n)
+                newdict = attr
+            except TypeError:
+                n, ndict = n
+                newdict = attr.copy()
+                newdict.update(ndict)
+            self.add_node(n, **newdict)
+        nx._clear_cache(self)
+
+    def add_edge(self, u_for_edge, v_for_edge, key=None, **attr):
+        u, v = u_for_edge, v_for_edge
+        new_nodes = [n for n in {u: None, v: None} if n not in self._node]
+        is_existing_edge = key is not None and key in self._adj.get(u, {}).get(v, {})
+        for n in new_nodes:
+            self._set_owned(("node", n), ("succ", n), ("pred", n))
+        if is_existing_edge:
+            self._unindex_edge(u, v, key)
+            data = attr.get("data", self._adj[u][v][key].get("data", {}))
+        else:
+            data = attr.get("data", {})
+
+        relation_class = get_relation_class(data)
+        kept_key = (
+            self._relation_index.get((u, v, relation_class[0]))
+            if relation_class is not None
+            else None
+        )
+        if kept_key is not None:
+            kept_data = self._adj[u][v][kept_key].get("data", {})
+            kept_precedence = get_relation_class(kept_data)[1]
+            if relation_class[1] >= kept_precedence:
+                if is_existing_edge:
+                    self._index_edge(u, v, key)
+                origins = {*kept_data.get("origins", []), *data.get("origins", [])}
+                if relation_class[1] == kept_precedence and origins != set(
+                    kept_data.get("origins", [])
+                ):
+                    # replace the data instead of updating it, it may be shared with
+                    # the graph it was copied from
+                    self._unindex_edge(u, v, kept_key)
+                    self._own_edge(u, v, kept_key)
+                    self._adj[u][v][kept_key]["data"] = self._get_stored_data(
+                        {**kept_data, "origins": origins}
+                    )
+                    self._index_edge(u, v, kept_key)
+                    self._relation_index[(u, v, relation_class[0])] = kept_key
+                return kept_key
+            # add the relation before removing the replaced one to keep the
+            # adjacency order of the graph
+            key = self._add_owned_edge(u, v, key, attr)
+            self.remove_edge(u, v, kept_key)
+        else:
+            key = self._add_owned_edge(u, v, key, attr)
+
+        for n in new_nodes:
+            self._index_node(n)
+        self._index_edge(u, v, key)
+        if relation_class is not None:
+            self._relation_index[(u, v, relation_class[0])] = key
+        return key
+
+    def _add_owned_edge(self, u, v, key, attr: dict):
+        # networkx updates the dicts of the relation and its adjacency in place
+        self._own_edge(u, v, key)
+        key = super().add_edge(u, v, key, **attr)
+        self._set_owned(("keys", u, v), ("edge", u, v, key))
+        return key
+
+    def add_edges_from(self, ebunch_to_add, **attr):
+        keylist = []
+        for e in ebunch_to_add:
+            ne = len(e)
+            if ne == 4:
+                u, v, key, dd = e
+            elif ne == 3:
+                u, v, dd = e
+                key = None
+            elif ne == 2:
+                u, v = e
+                dd = {}
+                key = None
+            else:
+                msg = f"Edge tuple {e} must be a 2-tuple, 3-tuple or 4-tuple."
+                raise NetworkXError(msg)
+            ddd = {}
+            ddd.update(attr)
+            try:
+                ddd.update(dd)
+            except (TypeError, ValueError):
+                if ne != 3:
+                    raise
+                key = dd  # ne == 3 with 3rd value not dict, must be a key
+            keylist.append(self.add_edge(u, v, key, **ddd))
+        nx._clear_cache(self)
+        return keylist
+
+    def remove_edge(self, u, v, key=None):
+        if key is None and self._adj.get(u, {}).get(v):
+            key = next(reversed(self._adj[u][v]))
+        if key in self._adj.get(u, {}).get(v, {}):
+            self._unindex_edge(u, v, key)
+        self._own_adjacency(u, v)
+        super().remove_edge(u, v, key)
+
+    def remove_node(self, n):
+        if n in self._node:
+            self._unindex_node_and_edges(n)
+            self._own_neighbors(n)
+        super().remove_node(n)
+
+    def remove_nodes_from(self, nodes):
+        nodes = list(nodes)
+        for n in nodes:
+            if n in self._node:
+                self._unindex_node_and_edges(n)
+                self._own_neighbors(n)
+        super().remove_nodes_from(nodes)
+
+    def _record_removed_edges(self) -> None:
+        if self._changes is not None:
+            for u, v, key, attr in self.edges(keys=True, data=True):
+                self._record_change(("edge", u, v, key), attr)
+
+    def clear(self):
+        self._record_removed_edges()
+        if self._changes is not None:
+            for n, attr in self._node.items():
+                self._record_change(("node", n), attr)
+        self._relation_index.clear()
+        self._node_index.clear()
+        self._edge_index.clear()
+        self._node_order.clear()
+        super().clear()
+
+    def clear_edges(self):
+        self._record_removed_edges()
+        self._relation_index.clear()
+        self._edge_index.clear()
+        if self._owned is not None:
+            # networkx clears the adjacency dicts, shared ones are replaced instead
+            for n in self._node:
+                self._succ[n] = self.adjlist_inner_dict_factory()
+                self._pred[n] = self.adjlist_inner_dict_factory()
+                self._set_owned(("succ", n), ("pred", n))
+        super().clear_edges()
+
+
+# landscape names are interned process wide, the origins of an element are stored as
+# a bitmask over them
+_origin_names: list[str] = []
+_origin_bits: dict[str, int] = {}
+_origin_lock = threading.Lock()
+
+
+def _get_origin_mask(origins) -> int:
+    mask = 0
+    for origin in origins:
+        bit = _origin_bits.get(origin)
+        if bit is None:
+            with _origin_lock:
+                bit = _origin_bits.setdefault(origin, len(_origin_names))
+                if bit == len(_origin_names):
+                    _origin_names.append(origin)
+        mask |= 1 << bit
+    return mask
+
+
+def _get_origins(mask: int) -> set[str]:
+    return {_origin_names[bit] for bit in range(mask.bit_length()) if mask >> bit & 1}
+
+
+class _PayloadDict(dict):
+    __slots__ = ("__weakref__",)
+
+
+class _PayloadList(list):
+    __slots__ = ("__weakref__",)
+
+
+# shared payloads by content, an entry is dropped once no element references it
+_payloads: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+_layouts: dict[tuple[str, ...], dict[str, int]] = {}
+
+
+def _get_payload_key(value) -> tuple:
+    if isinstance(value, (_PayloadDict, _PayloadList)):
+        return (type(value), id(value))
+    return (type(value), value)
+
+
+def _intern_payload(value):
+    if isinstance(value, (_PayloadDict, _PayloadList)):
+        return value
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        items = [(k, _intern_payload(v)) for k, v in value.items()]
+        try:
+            key = ("dict", *((k, _get_payload_key(v)) for k, v in items))
+            return _payloads.setdefault(key, _PayloadDict(items))
+        except TypeError:
+            return _PayloadDict(items)
+    if isinstance(value, list):
+        items = [_intern_payload(v) for v in value]
+        try:
+            key = ("list", *(_get_payload_key(v) for v in items))
+            return _payloads.setdefault(key, _PayloadList(items))
+        except TypeError:
+            return _PayloadList(items)
+    return value
+
+
+class CompactData(Mapping):
+    """
+    Read-only `data` of a node or relation of a CompactLandscapeGraph.
+
+    The keys are shared with all data of the same shape, the origins are a bitmask
+    of the interned landscape names and the values are shared payloads. Reading it
+    behaves like the data dict it was created from.
+    """
+
+    __slots__ = ("_layout", "_origins", "_values")
+
+    def __init__(self, data: Mapping):
+        keys = tuple(data)
+        layout = _layouts.get(keys)
+        if layout is None:
+            # the origins are not stored with the values
+            values_keys = [key for key in keys if key != "origins"]
+            layout = _layouts.setdefault(
+                keys,
+                {
+                    key: values_keys.index(key) if key != "origins" else -1
+                    for key in keys
+                },
+            )
+        self._layout = layout
+        self._values = tuple(
+            _intern_payload(value) for key, value in data.items() if key != "origins"
+        )
+        self._origins = _get_origin_mask(data.get("origins", ()))
+
+    def __getitem__(self, key):
+        index = self._layout[key]
+        if index < 0:
+            return _get_origins(self._origins)
+        return self._values[index]
+
+    def __contains__(self, key) -> bool:
+        return key in self._layout
+
+    def __iter__(self):
+        return iter(self._layout)
+
+    def __len__(self) -> int:
+        return len(self._layout)
+
+    def __repr__(self) -> str:
+        return f"CompactData({self.to_dict()!r})"
+
+    def __reduce__(self):
+        # origin bitmasks are only valid within a process
+        return CompactData, (self.to_dict(),)
+
+    def to_dict(self) -> dict:
+        return {key: self[key] for key in self._layout}
+
+
+def expand_data(data: Mapping) -> dict:
+    return data.to_dict() if isinstance(data, CompactData) else data
+
+
+class CompactLandscapeGraph(LandscapeGraph):
+    """
+    LandscapeGraph which keeps the data of its nodes and relations as CompactData
+    and interns its relation keys.
+
+    Data is compacted when it is inserted, it is expanded to the dict shape of a
+    LandscapeGraph when it is serialized with `expand_data`.
+    """
+
+    def _get_stored_data(self, data: Mapping) -> Mapping:
+        return data if isinstance(data, CompactData) else CompactData(data)
+
+    def add_node(self, node_for_adding, **attr):
+        if "data" in attr:
+            attr["data"] = self._get_stored_data(attr["data"])
+        super().add_node(node_for_adding, **attr)
+
+    def add_edge(self, u_for_edge, v_for_edge, key=None, **attr):
+        if isinstance(key, str):
+            # relation keys are hashes which are shared by many relations
+            key = sys.intern(key)
+        if "data" in attr:
+            attr["data"] = self._get_stored_data(attr["data"])
+        return super().add_edge(u_for_edge, v_for_edge, key, **attr)
+
+
+def to_compact_graph(G: nx.MultiDiGraph) -> CompactLandscapeGraph:
+    G_compact = CompactLandscapeGraph()
+    G_compact.graph.update(G.graph)
+    G_compact.add_nodes_from(G.nodes(data=True))
+    G_compact.add_edges_from(G.edges(keys=True, data=True))
+    return G_compact
+
+
+def get_nodes_of_type(G: nx.MultiDiGraph, node_type: str) -> list[tuple[str, dict]]:
+    if isinstance(G, LandscapeGraph):
+        return [(n, G.nodes[n]) for n in G.nodes_of_type(node_type)]
+    return [
+        (n, attr)
+        for n, attr in G.nodes(data=True)
+        if attr.get("data", {}).get("type") == node_type
+    ]
+
+
+def get_uploaded_nodes(G: nx.MultiDiGraph) -> list[tuple[str, dict]]:
+    if isinstance(G, LandscapeGraph):
+        return [(n, G.nodes[n]) for n in G.uploaded_nodes()]
+    return [
+        (n, attr)
+        for n, attr in G.nodes(data=True)
+        if attr.get("data", {}).get("isUploaded", False)
+    ]
+
+
+def get_edges_of_type(
+    G: nx.MultiDiGraph, relation_type: str
+) -> list[tuple[str, str, str, dict]]:
+    if isinstance(G, LandscapeGraph):
+        return [
+            (u, v, k, G.edges[u, v, k]) for u, v, k in G.edges_of_type(relation_type)
+        ]
+    return [
+        (u, v, k, attr)
+        for u, v, k, attr in G.edges(keys=True, data=True)
+        if attr.get("data", {}).get("type") == relation_type
+    ]
+
+
+def get_derived_edges(
+    G: nx.MultiDiGraph, is_derived: bool = True
+) -> list[tuple[str, str, str, dict]]:
+    if isinstance(G, LandscapeGraph):
+        return [(u, v, k, G.edges[u, v, k]) for u, v, k in G.derived_edges(is_derived)]
+    return [
+        (u, v, k, attr)
+        for u, v, k, attr in G.edges(keys=True, data=True)
+        if bool(attr.get("data", {}).get("is_derived", False)) == is_derived
+    ]
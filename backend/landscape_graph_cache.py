@@ -0,0 +1,124 @@
+import hashlib
+import importlib.util
+import logging
+import os
+import pickle
+import tempfile
+import time
+
+import networkx as nx
+
+_log = logging.getLogger(__name__)
+
+# the modules building the landscape graphs, graphs built by other sources of them
+# are not reused
+_builder_modules = ("graph", "landscape_graph", "landscape_merge")
+
+
+def get_builder_digest() -> str:
+    """
+    Digest of the sources of the modules building the landscape graphs.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    for module_name in _builder_modules:
+        with open(importlib.util.find_spec(module_name).origin, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class LandscapeGraphCache:
+    """
+    Built landscape graphs stored on disk, so that restarts do not rebuild the
+    graphs of unchanged landscapes. A graph is looked up by everything its build
+    depends on: the digest of the landscape document, the landscape name, the build
+    options and `version`, the version of the build pipeline.
+
+    The sources of the builder are part of the key as well, graphs built by
+    changed code are not reused even if `version` was not bumped.
+
+    Graphs unused for more than `max_age_seconds` are deleted when a graph is
+    added, and then the least recently used ones until the graphs add up to at most
+    `max_bytes`.
+
+    The graphs are pickled, the directory must only be writable by the server.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        version: int,
+        max_bytes: int,
+        max_age_seconds: float,
+        builder_digest: str | None = None,
+    ):
+        self.directory = directory
+        self.version = version
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.builder_digest = (
+            builder_digest if builder_digest is not None else get_builder_digest()
+        )
+
+    def get_key(self, digest: str, landscape_name: str, *options) -> str:
+        key = (
+            self.version,
+            self.builder_digest,
+            nx.__version__,
+            digest,
+            landscape_name,
+            *options,
+        )
+        return hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pickle")
+
+    def get(self, key: str) -> nx.MultiDiGraph | None:
+        try:
+            with open(self._get_path(key), "rb") as f:
+                G = pickle.load(f)
+            # the modification time is the last use of the graph
+            os.utime(self._get_path(key))
+            return G
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, AttributeError, ImportError, pickle.UnpicklingError):
+            # unreadable graphs are built again and overwritten
+            _log.warning("Ignoring the cached landscape graph %s", key, exc_info=True)
+            return None
+
+    def put(self, key: str, G: nx.MultiDiGraph) -> None:
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # graphs are written to a temporary file first, concurrent readers never
+            # see a partial graph
+            with tempfile.NamedTemporaryFile(
+                dir=self.directory, suffix=".tmp", delete=False
+            ) as f:
+                pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, self._get_path(key))
+            self._evict()
+        except OSError:
+            _log.warning("Could not cache the landscape graph %s", key, exc_info=True)
+
+    def _evict(self) -> None:
+        graphs = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".pickle"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    graphs.append((stat.st_mtime, stat.st_size, entry.path))
+        graphs.sort()
+        size = sum(graph_size for _, graph_size, _ in graphs)
+        expired = time.time() - self.max_age_seconds
+        for mtime, graph_size, path in graphs:
+            if mtime >= expired and size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= graph_size
@@ -1,6 +1,10 @@
 import hashlib
 import json
 import logging
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
 from typing import Literal
 
 _log = logging.getLogger(__name__)
@@ -75,13 +79,188 @@ def _get_minified_relation(relation: dict) -> dict:
             return relation
 
 
-def get_relation_string(relation: dict) -> tuple[str, str]:
-    minified_relation = _get_minified_relation(dict(sorted(relation.items())))
-    stringified_relation = json.dumps(minified_relation, sort_keys=True)
-    generated_hash = hashlib.sha256(stringified_relation.encode("utf-8")).hexdigest()
+# The hash of a relation is used as its key in the graphs. The keys of a scheme never change, schemes other than v1 prefix their
+# keys with their version so they never collide with the keys of another scheme.
+RELATION_HASH_SCHEMES: dict[str, Callable[[bytes], str]] = {
+    "v1": lambda stringified_relation: hashlib.sha256(stringified_relation).hexdigest(),
+    "v2": lambda stringified_relation: f"v2:{hashlib.blake2b(stringified_relation, digest_size=32).hexdigest()}",
+}
+RELATION_HASH_SCHEME = os.environ.get("RELATION_HASH_SCHEME", "v1")
+RELATION_HASH_CACHE_SIZE = 8192
+
+_ENDPOINT_RELATION_TYPES = {"1-1", "1-n", "1-n-selection", "n-1"}
+_MAPPING_RELATION_TYPES = {"m-n", "m-n-selection", "entity-mapping-reference-table", "ordino-drilldown"}
+
+
+class _RelationHashCache:
+    """
+    Bounded LRU cache of relation strings by relation fingerprint.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[str, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> tuple[str, str] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: tuple[str, str]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+
+_relation_hash_cache = _RelationHashCache(RELATION_HASH_CACHE_SIZE)
+
+
+def _get_value_fingerprint(value) -> object:
+    # tuples compare True == 1 == 1.0, json does not
+    if isinstance(value, dict):
+        return (dict, tuple(sorted((k, _get_value_fingerprint(v)) for k, v in value.items())))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(_get_value_fingerprint(v) for v in value))
+    if value is None or type(value) is str:
+        return value
+    return (type(value), value)
+
+
+def _get_relation_fingerprint(relation: dict) -> tuple:
+    """
+    Structural fingerprint of the minified relation, equal fingerprints have equal relation strings.
+    """
+    relation_type = relation.get("type")
+    if relation_type == "entity-mapping-same-table":
+        return (relation_type, _get_value_fingerprint(relation.get("entity")))
+    if relation_type not in _ENDPOINT_RELATION_TYPES and relation_type not in _MAPPING_RELATION_TYPES:
+        return (None, _get_value_fingerprint(relation))
+
+    source, target = relation.get("source", {}), relation.get("target", {})
+    fingerprint = (
+        relation_type,
+        _get_value_fingerprint(source.get("id")),
+        _get_value_fingerprint(source.get("key")),
+        _get_value_fingerprint(target.get("id")),
+        _get_value_fingerprint(target.get("key")),
+    )
+    if relation_type in _MAPPING_RELATION_TYPES and relation.get("mapping"):
+        fingerprint += (
+            tuple(
+                (
+                    _get_value_fingerprint(m.get("entity")),
+                    _get_value_fingerprint(m.get("sourceKey")),
+                    _get_value_fingerprint(m.get("targetKey")),
+                    tuple(_get_value_fingerprint(c.get("columnName")) for c in m.get("columns", [])) if m.get("columns") else (),
+                )
+                for m in relation.get("mapping", [])
+            ),
+        )
+    else:
+        fingerprint += (None,)
+    if relation_type == "ordino-drilldown" and relation.get("workbench"):
+        fingerprint += (tuple(_get_value_fingerprint(v.get("type", "")) for v in relation.get("workbench", {}).get("views", []) or []),)
+    return fingerprint
+
+
+def _get_uncached_relation_string(relation: dict, scheme: str) -> tuple[str, str]:
+    stringified_relation = json.dumps(_get_minified_relation(relation), sort_keys=True)
+    generated_hash = RELATION_HASH_SCHEMES[scheme](stringified_relation.encode("utf-8"))
     return generated_hash, stringified_relation
 
 
+def _get_relation_scheme(scheme: str | None) -> str:
+    scheme = scheme or RELATION_HASH_SCHEME
+    if scheme not in RELATION_HASH_SCHEMES:
+        raise ValueError(f"Unknown relation hash scheme {scheme}, expected one of {', '.join(RELATION_HASH_SCHEMES)}")
+    return scheme
+
+
+def _get_relation_cache_key(relation: dict, scheme: str) -> tuple | None:
+    try:
+        key = (scheme, _get_relation_fingerprint(relation))
+        hash(key)
+        return key
+    except TypeError:
+        # relations with unhashable values are not cached
+        return None
+
+
+def _get_cached_relation_string(relation: dict, scheme: str, key: tuple | None) -> tuple[str, str]:
+    if key is None:
+        return _get_uncached_relation_string(relation, scheme)
+    relation_string = _relation_hash_cache.get(key)
+    if relation_string is None:
+        relation_string = _get_uncached_relation_string(relation, scheme)
+        _relation_hash_cache.put(key, relation_string)
+    return relation_string
+
+
+def get_relation_string(relation: dict, scheme: str | None = None) -> tuple[str, str]:
+    scheme = _get_relation_scheme(scheme)
+    return _get_cached_relation_string(relation, scheme, _get_relation_cache_key(relation, scheme))
+
+
+def get_relation_strings(relations: list[dict], scheme: str | None = None) -> list[tuple[str, str]]:
+    """
+    Hash a batch of relations, equal relations within the batch are hashed once even if they are evicted from the cache.
+    """
+    scheme = _get_relation_scheme(scheme)
+    relation_strings_by_key: dict[tuple, tuple[str, str]] = {}
+    relation_strings = []
+    for relation in relations:
+        key = _get_relation_cache_key(relation, scheme)
+        relation_string = relation_strings_by_key.get(key) if key is not None else None
+        if relation_string is None:
+            relation_string = _get_cached_relation_string(relation, scheme, key)
+            if key is not None:
+                relation_strings_by_key[key] = relation_string
+        relation_strings.append(relation_string)
+    return relation_strings
+
+
+def get_relation_hash_cache_info() -> dict:
+    return _relation_hash_cache.info()
+
+
+class _LandscapeIndex:
+    """
+    The position of the first database, schema or entity with each key in the lists of the base landscape, built once per
+    list. The items a merge appends are indexed once it is done: they only match the items of the next merges
+    """
+
+    def __init__(self):
+        self._positions: dict[tuple[int, ...], dict[str, int]] = {}
+
+    def get(self, path: tuple[int, ...], items: list[dict], get_key: Callable[[dict], str]) -> dict[str, int]:
+        positions = self._positions.get(path)
+        if positions is None:
+            positions = {}
+            for i, item in enumerate(items):
+                positions.setdefault(get_key(item), i)
+            self._positions[path] = positions
+        return positions
+
+
 def merge_landscape_entities(
     base: dict,
     database: dict,
@@ -91,6 +270,7 @@ def merge_landscape_entities(
     landscape_name: str,
     landscape_type: str,
     is_updating_landscape: bool,
+    index: _LandscapeIndex | None = None,
 ) -> dict | None:
     """
     Merge multiple landscape entities into one
@@ -109,45 +289,35 @@ def merge_landscape_entities(
         _log.info("No entities to merge or replace")
         return base
 
-    matching_entity_table_names = [
-        get_entity_id(entity)
-        for entity in schema.get("entities", [])
-        if get_entity_id(entity)
-        in [
-            get_entity_id(base_entity)
-            for base_entity in base.get("databases", [])[database_index].get("schemas", [])[schema_index].get("entities", [])
-        ]
-    ]
+    index = index or _LandscapeIndex()
+    base_entities = base.get("databases", [])[database_index].get("schemas", [])[schema_index].get("entities", [])
+    entity_positions = index.get((database_index, schema_index), base_entities, get_entity_id)
 
+    added_entity_positions = {}
     for entity in schema.get("entities", []):
-        if get_entity_id(entity) in matching_entity_table_names:
-            matching_entity_in_base = next(
-                i
-                for i, base_entity in enumerate(
-                    base.get("databases", [])[database_index].get("schemas", [])[schema_index].get("entities", [])
+        entity_id = get_entity_id(entity)
+        matching_entity_in_base = entity_positions.get(entity_id)
+        if matching_entity_in_base is not None:
+            if is_updating_landscape:
+                _log.debug(
+                    f"Updating entity {entity.get('tableName')} within schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type})."
                 )
-                if get_entity_id(base_entity) == get_entity_id(entity)
-            )
-
-            if matching_entity_in_base is not None:
-                if is_updating_landscape:
-                    _log.debug(
-                        f"Updating entity {entity.get('tableName')} within schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type})."
-                    )
-                else:
-                    _log.debug(
-                        f"Entity {entity.get('tableName')} within schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type}) already exists in the flattened landscape."
-                    )
-                    _log.debug(
-                        f"Replacing entity {entity.get('tableName')} within schema {schema.get('name')} under database {database.get('id')} in the flattened landscape with entity from landscape {landscape_name} (from {landscape_type})."
-                    )
-                base["databases"][database_index]["schemas"][schema_index]["entities"][matching_entity_in_base] = entity
+            else:
+                _log.debug(
+                    f"Entity {entity.get('tableName')} within schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type}) already exists in the flattened landscape."
+                )
+                _log.debug(
+                    f"Replacing entity {entity.get('tableName')} within schema {schema.get('name')} under database {database.get('id')} in the flattened landscape with entity from landscape {landscape_name} (from {landscape_type})."
+                )
+            base["databases"][database_index]["schemas"][schema_index]["entities"][matching_entity_in_base] = entity
         else:
             if not is_updating_landscape:
                 _log.debug(
                     f"Adding new entity {entity.get('tableName')} within schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type})"
                 )
+            added_entity_positions.setdefault(entity_id, len(base["databases"][database_index]["schemas"][schema_index]["entities"]))
             base["databases"][database_index]["schemas"][schema_index]["entities"].append(entity)
+    entity_positions.update(added_entity_positions)
     return base
 
 
@@ -158,6 +328,7 @@ def merge_landscape_schemas(
     landscape_name: str,
     landscape_type: str,
     is_updating_landscape: bool,
+    index: _LandscapeIndex | None = None,
 ) -> dict:
     """
     Merge multiple landscape schemas into one
@@ -179,51 +350,53 @@ def merge_landscape_schemas(
         _log.info("No schemas to merge")
         return base
 
-    matching_schema_names = [
-        get_schema_string(schema)
-        for schema in database.get("schemas", [])
-        if get_schema_string(schema)
-        in [get_schema_string(base_schema) for base_schema in base.get("databases", [])[database_index].get("schemas", [])]
-    ]
+    index = index or _LandscapeIndex()
+    base_schemas = base.get("databases", [])[database_index].get("schemas", [])
+    schema_positions = index.get((database_index,), base_schemas, get_schema_string)
 
+    added_schema_positions = {}
     for schema in database.get("schemas", []):
-        if get_schema_string(schema) in matching_schema_names:
-            matching_schema_index = next(
-                i
-                for i, base_schema in enumerate(base.get("databases")[database_index].get("schemas"))
-                if get_schema_string(schema) == get_schema_string(base_schema)
-            )
-            if matching_schema_index is not None:
-                if is_updating_landscape:
-                    _log.debug(
-                        f"Updating schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type})."
-                    )
-                else:
-                    _log.debug(
-                        f"Schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type}) already exists in the flattened landscape."
-                    )
-                base = merge_landscape_entities(
-                    base=base,
-                    database=database,
-                    database_index=database_index,
-                    schema=schema,
-                    schema_index=matching_schema_index,
-                    landscape_name=landscape_name,
-                    landscape_type=landscape_type,
-                    is_updating_landscape=is_updating_landscape,
+        schema_string = get_schema_string(schema)
+        matching_schema_index = schema_positions.get(schema_string)
+        if matching_schema_index is not None:
+            if is_updating_landscape:
+                _log.debug(
+                    f"Updating schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type})."
                 )
+            else:
+                _log.debug(
+                    f"Schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type}) already exists in the flattened landscape."
+                )
+            base = merge_landscape_entities(
+                base=base,
+                database=database,
+                database_index=database_index,
+                schema=schema,
+                schema_index=matching_schema_index,
+                landscape_name=landscape_name,
+                landscape_type=landscape_type,
+                is_updating_landscape=is_updating_landscape,
+                index=index,
+            )
         else:
             if not is_updating_landscape:
                 _log.debug(
                     f"Adding new schema {schema.get('name')} under database {database.get('id')} from landscape {landscape_name} (from {landscape_type})"
                 )
+            added_schema_positions.setdefault(schema_string, len(base["databases"][database_index]["schemas"]))
             base["databases"][database_index]["schemas"].append(schema)
+    schema_positions.update(added_schema_positions)
 
     return base
 
 
 def merge_landscape_databases(
-    base: dict, landscape: dict | None, landscape_name: str, landscape_type: str, is_updating_landscape: bool
+    base: dict,
+    landscape: dict | None,
+    landscape_name: str,
+    landscape_type: str,
+    is_updating_landscape: bool,
+    index: _LandscapeIndex | None = None,
 ) -> dict:
     """
     Merge multiple landscape databases into one
@@ -240,38 +413,35 @@ def merge_landscape_databases(
         _log.info("No databases to merge")
         return base
 
-    matching_database_ids = [
-        get_database_string(db)
-        for db in landscape.get("databases", [])
-        if get_database_string(db) in [get_database_string(base_db) for base_db in base.get("databases")]
-    ]
+    index = index or _LandscapeIndex()
+    database_positions = index.get((), base.get("databases"), get_database_string)
 
+    added_database_positions = {}
     for database in landscape.get("databases", []):
-        if get_database_string(database) in matching_database_ids:
-            matching_database_index = next(
-                i for i, base_db in enumerate(base.get("databases", [])) if get_database_string(base_db) == get_database_string(database)
-            )
-            if matching_database_index is not None:
-                if is_updating_landscape:
-                    _log.debug(
-                        f"Updating database {get_database_string(database)} from landscape {landscape_name} (from {landscape_type})."
-                    )
-                else:
-                    _log.debug(
-                        f"Database {get_database_string(database)} from landscape {landscape_name} (from {landscape_type}) already exists in the flattened landscape."
-                    )
-                base = merge_landscape_schemas(
-                    base=base,
-                    database=database,
-                    database_index=matching_database_index,
-                    landscape_name=landscape_name,
-                    landscape_type=landscape_type,
-                    is_updating_landscape=is_updating_landscape,
+        database_string = get_database_string(database)
+        matching_database_index = database_positions.get(database_string)
+        if matching_database_index is not None:
+            if is_updating_landscape:
+                _log.debug(f"Updating database {database_string} from landscape {landscape_name} (from {landscape_type}).")
+            else:
+                _log.debug(
+                    f"Database {database_string} from landscape {landscape_name} (from {landscape_type}) already exists in the flattened landscape."
                 )
+            base = merge_landscape_schemas(
+                base=base,
+                database=database,
+                database_index=matching_database_index,
+                landscape_name=landscape_name,
+                landscape_type=landscape_type,
+                is_updating_landscape=is_updating_landscape,
+                index=index,
+            )
         else:
             if not is_updating_landscape:
-                _log.debug(f"Adding new database {get_database_string(database)} from landscape {landscape_name} (from {landscape_type})")
+                _log.debug(f"Adding new database {database_string} from landscape {landscape_name} (from {landscape_type})")
+            added_database_positions.setdefault(database_string, len(base["databases"]))
             base["databases"].append(database)
+    database_positions.update(added_database_positions)
     return base
 
 
@@ -335,16 +505,15 @@ def merge_landscape_relations(
         relation_hash, stringified_relation = get_relation_string(relation)
         _log.warning(f"Omitting relation {stringified_relation} from landscape {landscape_name} (from {landscape_type}) because {reason}.")
 
-    base_relation_hashes = [get_relation_string(base_relation)[0] for base_relation in base.get("relations", [])]
+    base_relation_hashes = [relation_hash for relation_hash, _ in get_relation_strings(base.get("relations", []))]
+    filtered_relation_strings = get_relation_strings(filtered_relations)
     matching_relation_hashes = []
 
-    for relation in filtered_relations:
-        relation_hash, stringified_relation = get_relation_string(relation)
+    for relation_hash, stringified_relation in filtered_relation_strings:
         if relation_hash in base_relation_hashes:
             matching_relation_hashes.append(relation_hash)
 
-    for relation in filtered_relations:
-        relation_hash, stringified_relation = get_relation_string(relation)
+    for relation, (relation_hash, stringified_relation) in zip(filtered_relations, filtered_relation_strings):
         if relation_hash in matching_relation_hashes:
             matching_relation_index_in_base = next(
                 i for i, base_relation_hash in enumerate(base_relation_hashes) if base_relation_hash == relation_hash
@@ -649,6 +818,7 @@ def merge_landscape_dict(
         _log.info("All the dashboards across all the landscapes merged successfully!")
 
     landscape_names = [f"{base_landscape_name}"]
+    index = _LandscapeIndex()
     for landscape_object in filtered_landscapes:
         landscape = landscape_object.get("json_obj", None)
         landscape_name = landscape_object.get("name", None)
@@ -660,6 +830,7 @@ def merge_landscape_dict(
             landscape_name=landscape_name,
             landscape_type=landscape_type,
             is_updating_landscape=is_updating_landscape,
+            index=index,
         )
         if is_updating_landscape:
             _log.info(f"Updating entities of landscape {landscape_name} (from {landscape_type})")
@@ -1,9 +1,28 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+
+from graph_metrics import get_metrics_text
+from graph_router import (
+    get_readiness,
+    graph_router,
+    preload_landscapes,
+    shutdown_landscape_builds,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the server accepts requests while the landscapes are preloaded in the
+    # background, /health reports when the graph is ready
+    preload_landscapes()
+    yield
+    shutdown_landscape_builds()
 
-from graph_router import graph_router
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -15,6 +34,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # the graph routes send the version of the graph, clients ask for deltas with it
+    expose_headers=["ETag", "X-Graph-Version"],
 )
 
 app.include_router(graph_router)
@@ -23,3 +44,18 @@ app.include_router(graph_router)
 @app.get("/")
 def hello_world():
     return {"message": "Hello, World!"}
+
+
+@app.get("/health")
+def health():
+    readiness = get_readiness()
+    return JSONResponse(
+        readiness, status_code=200 if readiness["status"] == "ready" else 503
+    )
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(
+        get_metrics_text(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+# the router is configured from the environment when it is imported, the tests
+# build the graphs without the disk cache and start without preloaded landscapes
+os.environ["LANDSCAPE_GRAPH_CACHE_DIR"] = ""
+os.environ["PRELOAD_LANDSCAPES"] = ""
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+
+    import graph_router
+    from main import app
+
+    with TestClient(app) as client:
+        client.post("/api/graph/reset_graph")
+        yield client
+    with graph_router._response_cache_lock:
+        graph_router._response_cache.clear()
@@ -0,0 +1,161 @@
+import copy
+import json
+from pathlib import Path
+
+import networkx as nx
+import pytest
+
+from benchmarks.synthetic import generate_synthetic_landscape
+from graph import (
+    add_landscape_to_graph,
+    build_landscape_graph,
+    deduplicate_relations,
+    expand_implicit_idtype_relations,
+    populate_graph,
+    populate_idtype_relations,
+    populate_one_to_n_relations,
+    populate_ordino_drilldown_relations,
+    remove_landscape_from_graph,
+)
+from landscape_graph import LandscapeGraph, to_compact_graph
+
+
+def _load(landscape_name: str) -> LandscapeGraph:
+    if landscape_name.startswith("synthetic_"):
+        # landscapes of the same entities, with relations of the same class and
+        # different keys between the same entities
+        payload = generate_synthetic_landscape(
+            seed=int(landscape_name.removeprefix("synthetic_")),
+            databases=1,
+            schemas=1,
+            entities=4,
+            one_to_n_relations=12,
+            drilldown_relations=0,
+        )
+        return build_landscape_graph(payload, landscape_name)
+    with open(f"data/{landscape_name}.json") as f:
+        return build_landscape_graph(json.load(f), landscape_name)
+
+
+_data_landscape_names = sorted(path.stem for path in Path("data").glob("*.json"))
+
+
+def _get_elements(G: LandscapeGraph) -> tuple[dict, dict]:
+    return (
+        dict(G.nodes(data=True)),
+        {(u, v, k): attr for u, v, k, attr in G.edges(keys=True, data=True)},
+    )
+
+
+@pytest.mark.parametrize(
+    ("landscape_names", "removed"),
+    [
+        (["visyn_kb", "ordino_gsk_eng"], "visyn_kb"),
+        (["visyn_kb", "ordino_gsk_eng"], "ordino_gsk_eng"),
+        (["ordino_gsk_eng", "visyn_kb"], "visyn_kb"),
+        (["ordino_gsk_eng", "visyn_kb"], "ordino_gsk_eng"),
+        (["synthetic_1", "synthetic_2"], "synthetic_1"),
+        (["synthetic_1", "synthetic_2", "synthetic_3"], "synthetic_1"),
+        (["synthetic_1", "synthetic_2", "synthetic_3"], "synthetic_2"),
+    ],
+)
+def test_remove_landscape_equals_recompose(landscape_names: list[str], removed: str):
+    landscape_graphs = {name: _load(name) for name in landscape_names}
+    G = LandscapeGraph()
+    for G_landscape in landscape_graphs.values():
+        add_landscape_to_graph(G, G_landscape)
+    remaining_graphs = [Gl for name, Gl in landscape_graphs.items() if name != removed]
+    remove_landscape_from_graph(G, removed, remaining_graphs)
+
+    G_expected = LandscapeGraph()
+    for G_landscape in remaining_graphs:
+        add_landscape_to_graph(G_expected, G_landscape)
+    assert _get_elements(G) == _get_elements(G_expected)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_copy_on_write_equals_copy(compact: bool):
+    landscape_graphs = {
+        name: _load(name) for name in ["synthetic_1", "synthetic_2", "synthetic_3"]
+    }
+    G = LandscapeGraph()
+    for name in ["synthetic_1", "synthetic_2"]:
+        add_landscape_to_graph(G, landscape_graphs[name])
+    if compact:
+        G = to_compact_graph(G)
+    nx.freeze(G)
+    elements = copy.deepcopy(_get_elements(G))
+
+    G_copies = [G.copy(), G.copy_on_write()]
+    for G_copy in G_copies:
+        add_landscape_to_graph(G_copy, landscape_graphs["synthetic_3"])
+        remove_landscape_from_graph(
+            G_copy,
+            "synthetic_1",
+            [landscape_graphs["synthetic_2"], landscape_graphs["synthetic_3"]],
+        )
+    assert _get_elements(G_copies[1]) == _get_elements(G_copies[0])
+    # the copied graph is shared, it must not change
+    assert _get_elements(G) == elements
+
+
+def _get_relations(G: LandscapeGraph) -> dict:
+    # the columns of implicit relations are the ones of the merged entities, the
+    # eager ones are the columns of the landscape relating the entities last
+    return {
+        (u, v, k): (
+            attr["data"].get("type"),
+            attr["data"].get("via_idtype"),
+            set(attr["data"].get("origins", [])),
+        )
+        for u, v, k, attr in G.edges(keys=True, data=True)
+    }
+
+
+@pytest.mark.parametrize(
+    "landscape_names",
+    [
+        ["visyn_kb"],
+        ["ordino_gsk_eng", "visyn_kb"],
+        ["ordino_gsk_eng", "visyn_kb", "visyn_kb_fileserver_dev"],
+        ["landscape_s_general_d_gyst_mars", "ordino_JnJ_test", "visyn_kb"],
+    ],
+)
+def test_expand_implicit_relations_equals_eager(landscape_names: list[str]):
+    G_eager = LandscapeGraph()
+    G_implicit = LandscapeGraph()
+    for name in landscape_names:
+        with open(f"data/{name}.json") as f:
+            payload = json.load(f)
+        add_landscape_to_graph(G_eager, build_landscape_graph(payload, name))
+        # every idtype connecting an entity is kept implicit
+        add_landscape_to_graph(G_implicit, build_landscape_graph(payload, name, 0))
+    assert G_implicit.graph["implicit_idtypes"]
+
+    G_expanded = expand_implicit_idtype_relations(G_implicit)
+    assert _get_relations(G_expanded) == _get_relations(G_eager)
+
+
+@pytest.mark.parametrize("max_idtype_fanout", [None, 2])
+@pytest.mark.parametrize("landscape_name", _data_landscape_names)
+def test_build_landscape_graph_equals_populate_stages(
+    landscape_name: str, max_idtype_fanout: int | None
+):
+    with open(f"data/{landscape_name}.json") as f:
+        payload = json.load(f)
+    G = build_landscape_graph(payload, landscape_name, max_idtype_fanout)
+
+    G_populated = populate_graph(payload, landscape_name)
+    G_populated = populate_idtype_relations(
+        G_populated, landscape_name, max_idtype_fanout
+    )
+    G_populated = populate_one_to_n_relations(G_populated, payload, landscape_name)
+    G_populated = populate_ordino_drilldown_relations(
+        G_populated, payload, landscape_name
+    )
+    assert _get_elements(G) == _get_elements(G_populated)
+    assert list(G.edges(keys=True)) == list(G_populated.edges(keys=True))
+    assert G.graph == G_populated.graph
+    # the relations of a plain graph are deduplicated by scanning them
+    G_deduplicated = deduplicate_relations(nx.MultiDiGraph(G_populated))
+    assert _get_elements(G) == _get_elements(G_deduplicated)
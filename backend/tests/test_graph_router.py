@@ -0,0 +1,347 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+
+import graph_router
+
+_graph_params = {"with_idtype_nodes": True, "remove_isolated_nodes": False}
+
+
+def test_cached_response_is_revalidated_with_its_etag(client):
+    client.post("/api/graph/add_landscapes", json=["test_db1"])
+    response = client.get("/api/graph/get_graph", params=_graph_params)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    version = response.headers["X-Graph-Version"]
+    assert etag.startswith(f'"{version}-')
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    for if_none_match in [etag, f"W/{etag}", f'"other", {etag}', "*"]:
+        response = client.get(
+            "/api/graph/get_graph",
+            params=_graph_params,
+            headers={"If-None-Match": if_none_match},
+        )
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+
+    # another view of the graph has another etag
+    response = client.get(
+        "/api/graph/get_graph",
+        params={**_graph_params, "with_idtype_nodes": False},
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_response_cache_evicts_the_least_recently_used(client, monkeypatch):
+    monkeypatch.setattr(graph_router, "_response_cache_size", 2)
+    serialized = []
+    get_node_link_data = graph_router.get_node_link_data
+
+    def get_counted_node_link_data(G):
+        serialized.append(G)
+        return get_node_link_data(G)
+
+    monkeypatch.setattr(graph_router, "get_node_link_data", get_counted_node_link_data)
+    client.post("/api/graph/add_landscapes", json=["test_db1"])
+
+    def get_graph(with_idtype_nodes: bool, remove_isolated_nodes: bool) -> bytes:
+        serialized.clear()
+        response = client.get(
+            "/api/graph/get_graph",
+            params={
+                "with_idtype_nodes": with_idtype_nodes,
+                "remove_isolated_nodes": remove_isolated_nodes,
+            },
+        )
+        assert response.status_code == 200
+        return response.content
+
+    a = get_graph(True, False)
+    assert serialized
+    b = get_graph(False, False)
+    assert serialized
+    assert get_graph(True, False) == a
+    assert not serialized
+    # the third view evicts the least recently used one, b
+    get_graph(True, True)
+    assert serialized
+    assert get_graph(True, False) == a
+    assert not serialized
+    assert get_graph(False, False) == b
+    assert serialized
+    assert len(graph_router._response_cache) == 2
+
+
+def test_response_cache_is_invalidated_by_a_new_version(client):
+    client.post("/api/graph/add_landscapes", json=["test_db1"])
+    response = client.get("/api/graph/get_graph", params=_graph_params)
+    etag = response.headers["ETag"]
+    nodes = response.json()["nodes"]
+    assert graph_router._response_cache
+
+    client.post("/api/graph/add_landscapes", json=["test_db2"])
+    assert not graph_router._response_cache
+    response = client.get(
+        "/api/graph/get_graph", params=_graph_params, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()["nodes"]) > len(nodes)
+
+
+def _get_elements(data: dict) -> tuple[dict, dict]:
+    # origins are sets in the graph, their order in the lists is not kept
+    def get_element(element: dict) -> dict:
+        if "origins" in element.get("data", {}):
+            data = {**element["data"], "origins": sorted(element["data"]["origins"])}
+            return {**element, "data": data}
+        return element
+
+    return (
+        {node["id"]: get_element(node) for node in data["nodes"]},
+        {
+            (edge["source"], edge["target"], edge["key"]): get_element(edge)
+            for edge in data["edges"]
+        },
+    )
+
+
+def _apply_delta(data: dict, delta: dict) -> dict:
+    nodes, edges = _get_elements(data)
+    for node in delta["nodes"]["removed"]:
+        del nodes[node]
+    for edge in delta["edges"]["removed"]:
+        del edges[(edge["source"], edge["target"], edge["key"])]
+    delta_nodes, delta_edges = _get_elements(
+        {
+            "nodes": delta["nodes"]["added"] + delta["nodes"]["changed"],
+            "edges": delta["edges"]["added"] + delta["edges"]["changed"],
+        }
+    )
+    return {
+        **data,
+        "graph": delta["graph"],
+        "nodes": list({**nodes, **delta_nodes}.values()),
+        "edges": list({**edges, **delta_edges}.values()),
+    }
+
+
+def _get_graph(client) -> dict:
+    return client.get("/api/graph/get_graph", params=_graph_params).json()
+
+
+def test_mutations_respond_with_the_delta_since_a_version(client):
+    response = client.post("/api/graph/add_landscapes", json=["visyn_kb"])
+    data = response.json()
+    version = response.headers["X-Graph-Version"]
+
+    for method, url, kwargs in [
+        ("post", "/api/graph/add_landscapes", {"json": ["ordino_gsk_eng"]}),
+        (
+            "delete",
+            "/api/graph/remove_landscape",
+            {"params": {"landscape_name": "visyn_kb"}},
+        ),
+        ("post", "/api/graph/add_random_uploaded_dataset", {}),
+    ]:
+        kwargs.setdefault("params", {})["since_version"] = version
+        response = client.request(method, url, **kwargs)
+        assert response.status_code == 200
+        content = response.json()
+        assert "graph" not in content
+        assert content["version"] == response.headers["X-Graph-Version"] != version
+        data = _apply_delta(data, content["delta"])
+        assert _get_elements(data) == _get_elements(_get_graph(client))
+        version = content["version"]
+
+
+def test_delta_covers_all_versions_since_the_known_one(client):
+    response = client.post("/api/graph/add_landscapes", json=["visyn_kb"])
+    data = response.json()
+    version = response.headers["X-Graph-Version"]
+    client.post("/api/graph/add_landscapes", json=["ordino_gsk_eng"])
+    client.delete("/api/graph/remove_landscape", params={"landscape_name": "visyn_kb"})
+
+    response = client.post(
+        "/api/graph/add_landscapes",
+        json=["test_db1"],
+        params={"since_version": version},
+    )
+    data = _apply_delta(data, response.json()["delta"])
+    assert _get_elements(data) == _get_elements(_get_graph(client))
+
+
+def test_unknown_versions_are_answered_with_the_whole_graph(client, monkeypatch):
+    monkeypatch.setattr(graph_router, "graph_changes_history_size", 2)
+    response = client.post("/api/graph/add_landscapes", json=["test_db1"])
+    first_version = response.headers["X-Graph-Version"]
+    epoch, _, number = first_version.rpartition("-")
+    client.post("/api/graph/add_landscapes", json=["test_db2"])
+    client.post("/api/graph/add_landscapes", json=["visyn_kb"])
+
+    for since_version in [
+        # older than the history of changes
+        first_version,
+        f"{epoch}-{int(number) + 10}",
+        f"other-{number}",
+        "unknown",
+    ]:
+        response = client.post(
+            "/api/graph/add_landscapes",
+            json=["ordino_gsk_eng"],
+            params={"since_version": since_version},
+        )
+        content = response.json()
+        assert "delta" not in content
+        assert content["version"] == response.headers["X-Graph-Version"]
+        assert _get_elements(content["graph"]) == _get_elements(_get_graph(client))
+
+
+def _get_stream_scope() -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/graph/stream",
+        "raw_path": b"/api/graph/stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"test")],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+
+
+async def _receive_stream_change():
+    # the test client buffers whole responses, the endless stream is read from the
+    # app directly until the client disconnects
+    from main import app
+
+    messages: asyncio.Queue[dict] = asyncio.Queue()
+    disconnected = asyncio.Event()
+    events: list[dict[str, str]] = []
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def read_event() -> dict[str, str]:
+        # keepalive comments are skipped, the fields of the next event are returned
+        while not events:
+            message = await asyncio.wait_for(messages.get(), 10)
+            for event in message["body"].decode().split("\n\n"):
+                lines = [
+                    line for line in event.splitlines() if not line.startswith(":")
+                ]
+                if lines:
+                    events.append(dict(line.split(": ", 1) for line in lines))
+        return events.pop(0)
+
+    stream = asyncio.create_task(app(_get_stream_scope(), receive, messages.put))
+    start = await asyncio.wait_for(messages.get(), 10)
+    assert start["type"] == "http.response.start"
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in start["headers"]
+
+    event = await read_event()
+    assert event["event"] == "snapshot"
+    assert json.loads(event["data"])["graph"]["nodes"] == []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post("/api/graph/add_landscapes", json=["test_db1"])
+        version = response.headers["X-Graph-Version"]
+
+    event = await read_event()
+    assert event["event"] == "change"
+    assert event["id"] == version
+    data = json.loads(event["data"])
+    assert data["version"] == version
+    assert data["delta"]["nodes"]["added"]
+
+    disconnected.set()
+    await asyncio.wait_for(stream, 10)
+
+
+def test_stream_pushes_changes_until_the_client_disconnects(client, monkeypatch):
+    monkeypatch.setattr(graph_router, "graph_stream_keepalive_seconds", 0.1)
+    asyncio.run(_receive_stream_change())
+    assert not graph_router.graph_stream._subscribers
+
+
+def _wait_for_job(client, job_id: str) -> dict:
+    for _ in range(200):
+        job = client.get(f"/api/graph/jobs/{job_id}").json()
+        if job["finishedAt"] is not None:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_landscape_job_is_polled_until_it_is_done(client):
+    response = client.post("/api/graph/jobs/add_landscapes", json=["test_db1"])
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] in ["queued", "running", "done"]
+
+    job = _wait_for_job(client, job["id"])
+    assert job["status"] == "done"
+    assert job["error"] is None
+    assert job["stages"]["merge"] == {"done": 1, "total": 1}
+    graph = client.get("/api/graph/get_graph", params=_graph_params)
+    assert job["result"]["version"] == graph.headers["X-Graph-Version"]
+    assert graph.json()["nodes"]
+
+
+def test_landscape_job_fails_without_publishing(client):
+    response = client.get("/api/graph/get_graph", params=_graph_params)
+    version = response.headers["X-Graph-Version"]
+    response = client.post("/api/graph/jobs/add_landscapes", json=["missing"])
+    assert response.status_code == 202
+
+    job = _wait_for_job(client, response.json()["id"])
+    assert job["status"] == "failed"
+    assert job["error"].startswith("FileNotFoundError: ")
+    assert job["result"] is None
+    response = client.get("/api/graph/get_graph", params=_graph_params)
+    assert response.headers["X-Graph-Version"] == version
+
+
+def test_landscape_job_is_cancelled_between_its_steps(client, monkeypatch):
+    loading, cancelled = threading.Event(), threading.Event()
+    load_with_digest = graph_router.landscape_files.load_with_digest
+
+    def load_until_cancelled(path: str):
+        loading.set()
+        cancelled.wait(10)
+        return load_with_digest(path)
+
+    monkeypatch.setattr(
+        graph_router.landscape_files, "load_with_digest", load_until_cancelled
+    )
+    response = client.post("/api/graph/jobs/add_landscapes", json=["test_db1"])
+    job_id = response.json()["id"]
+    assert loading.wait(10)
+    response = client.delete(f"/api/graph/jobs/{job_id}")
+    assert response.status_code == 200
+    cancelled.set()
+
+    job = _wait_for_job(client, job_id)
+    assert job["status"] == "cancelled"
+    assert job["stages"]["load"] == {"done": 1, "total": 1}
+    assert job["stages"]["build"]["done"] == 0
+    assert not _get_graph(client)["nodes"]
+
+
+def test_unknown_jobs_are_not_found(client):
+    assert client.get("/api/graph/jobs/unknown").status_code == 404
+    assert client.delete("/api/graph/jobs/unknown").status_code == 404
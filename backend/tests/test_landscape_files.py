@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+import landscape_files
+from landscape_files import LandscapeCatalog, get_landscape_file_stats
+
+_landscape = {
+    "databases": [
+        {"schemas": [{"entities": [{"id": "a"}, {"id": "b"}]}, {"entities": [{}]}]},
+        {"schemas": []},
+    ],
+    "idtypes": [{"id": "x"}, {"id": "y"}],
+    "relations": [{"type": "1-n"}, {"type": "1-n"}, {"type": "1-1"}, {}],
+}
+_landscape_stats = {
+    "databases": 2,
+    "entities": 3,
+    "idtypes": 2,
+    "relations": {"1-n": 2, "1-1": 1},
+}
+
+
+@pytest.fixture(params=["streamed", "parsed"])
+def hashing(request, monkeypatch):
+    if request.param == "streamed":
+        monkeypatch.setattr(landscape_files, "ijson", pytest.importorskip("ijson"))
+    else:
+        monkeypatch.setattr(landscape_files, "ijson", None)
+    return request.param
+
+
+def test_landscape_file_stats_and_digest(hashing, tmp_path):
+    path = tmp_path / "landscape.json"
+    path.write_text(json.dumps(_landscape))
+    stats, digest = get_landscape_file_stats(str(path))
+    assert stats == _landscape_stats
+    assert digest == hashlib.blake2b(path.read_bytes()).hexdigest()
+
+    # invalid files are hashed whole, without stats
+    path.write_bytes(b'{"databases": [' + b" " * (1 << 17) + b"}")
+    stats, digest = get_landscape_file_stats(str(path))
+    assert stats is None
+    assert digest == hashlib.blake2b(path.read_bytes()).hexdigest()
+
+
+def test_catalog_rereads_files_changed_in_place(hashing, tmp_path, monkeypatch):
+    (tmp_path / "a.json").write_text(json.dumps(_landscape))
+    (tmp_path / "b.json").write_text(json.dumps({"idtypes": []}))
+    (tmp_path / "notes.txt").write_text("not a landscape")
+    catalog = LandscapeCatalog(str(tmp_path))
+    entries = {entry["name"]: entry for entry in catalog.get_entries()}
+    assert sorted(entries) == ["a", "b"]
+    assert entries["a"]["stats"] == _landscape_stats
+
+    read_paths = []
+    get_stats = landscape_files.get_landscape_file_stats
+
+    def get_recorded_stats(path: str):
+        read_paths.append(os.path.basename(path))
+        return get_stats(path)
+
+    monkeypatch.setattr(landscape_files, "get_landscape_file_stats", get_recorded_stats)
+    # the directory keeps its modification time when a file is rewritten
+    directory_stat = os.stat(tmp_path)
+    (tmp_path / "b.json").write_text(json.dumps(_landscape) + "\n")
+    os.utime(tmp_path, ns=(directory_stat.st_atime_ns, directory_stat.st_mtime_ns))
+
+    entries = {entry["name"]: entry for entry in catalog.get_entries()}
+    assert read_paths == ["b.json"]
+    assert entries["b"]["stats"] == _landscape_stats
+    assert entries["b"]["size"] == os.path.getsize(tmp_path / "b.json")
+    assert entries["b"]["digest"] != entries["a"]["digest"]
+
+    catalog.get_entries()
+    assert read_paths == ["b.json"]
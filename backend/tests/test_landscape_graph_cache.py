@@ -0,0 +1,64 @@
+import os
+import time
+
+import networkx as nx
+
+from landscape_graph_cache import LandscapeGraphCache, get_builder_digest
+
+
+def _get_cache(directory, **kwargs) -> LandscapeGraphCache:
+    return LandscapeGraphCache(
+        str(directory),
+        1,
+        **{"max_bytes": 2**20, "max_age_seconds": 3600, **kwargs},
+    )
+
+
+def _get_graph(n: int) -> nx.MultiDiGraph:
+    G = nx.MultiDiGraph()
+    G.add_edges_from((i, i + 1) for i in range(n))
+    return G
+
+
+def test_key_depends_on_the_builder_sources(tmp_path):
+    cache = _get_cache(tmp_path)
+    assert cache.builder_digest == get_builder_digest()
+    key = cache.get_key("digest", "visyn_kb", None)
+    assert key == _get_cache(tmp_path).get_key("digest", "visyn_kb", None)
+    changed = _get_cache(tmp_path, builder_digest="changed")
+    assert changed.get_key("digest", "visyn_kb", None) != key
+
+    cache.put(key, _get_graph(3))
+    assert nx.utils.edges_equal(cache.get(key).edges, _get_graph(3).edges)
+    assert changed.get(changed.get_key("digest", "visyn_kb", None)) is None
+
+
+def test_least_recently_used_graphs_are_evicted(tmp_path):
+    cache = _get_cache(tmp_path)
+    for key in ["a", "b", "c"]:
+        cache.put(key, _get_graph(100))
+    size = os.path.getsize(tmp_path / "a.pickle")
+    # a was used last, b is evicted for d
+    now = time.time()
+    for i, key in enumerate(["b", "c", "a"]):
+        os.utime(tmp_path / f"{key}.pickle", (now - 10 + i, now - 10 + i))
+    cache.max_bytes = 3 * size + size // 2
+    cache.put("d", _get_graph(100))
+    assert sorted(os.listdir(tmp_path)) == ["a.pickle", "c.pickle", "d.pickle"]
+
+    # a lookup is a use
+    os.utime(tmp_path / "c.pickle", (now - 20, now - 20))
+    assert cache.get("c") is not None
+    cache.put("e", _get_graph(100))
+    assert sorted(os.listdir(tmp_path)) == ["c.pickle", "d.pickle", "e.pickle"]
+
+
+def test_expired_graphs_are_evicted(tmp_path):
+    cache = _get_cache(tmp_path, max_age_seconds=60)
+    cache.put("a", _get_graph(3))
+    cache.put("b", _get_graph(3))
+    expired = time.time() - 120
+    os.utime(tmp_path / "a.pickle", (expired, expired))
+    cache.put("c", _get_graph(3))
+    assert sorted(os.listdir(tmp_path)) == ["b.pickle", "c.pickle"]
+    assert cache.get("a") is None
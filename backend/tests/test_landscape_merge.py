@@ -0,0 +1,140 @@
+import copy
+import json
+import random
+from pathlib import Path
+
+import pytest
+
+import landscape_merge
+from landscape_merge import (
+    RELATION_HASH_SCHEMES,
+    _get_relation_cache_key,
+    _get_uncached_relation_string,
+    _RelationHashCache,
+    get_relation_string,
+    get_relation_strings,
+    merge_landscape_dict,
+)
+
+# the m-n relations of these landscapes cannot be merged
+_unmergeable_landscape_names = {"ordino_bi", "ordino_public"}
+_landscape_payloads = {
+    path.stem: json.loads(path.read_text())
+    for path in sorted(Path("data").glob("*.json"))
+    if path.stem not in _unmergeable_landscape_names
+}
+
+
+_relations = [
+    relation
+    for path in sorted(Path("data").glob("*.json"))
+    for relation in json.loads(path.read_text()).get("relations", [])
+]
+
+
+class _ScanningIndex:
+    # the positions of the keys are scanned from the base lists by every merge
+    def get(self, path, items, get_key):
+        positions = {}
+        for i, item in enumerate(items):
+            positions.setdefault(get_key(item), i)
+        return positions
+
+
+def _get_landscapes(landscape_names: list[str]) -> list[dict]:
+    return [
+        {
+            "name": name,
+            "type": "file",
+            "json_obj": copy.deepcopy(_landscape_payloads[name]),
+        }
+        for name in landscape_names
+    ]
+
+
+def _get_landscape_names(seed: int) -> list[str]:
+    names = sorted(_landscape_payloads)
+    if seed == 0:
+        return names
+    if seed == 1:
+        return names[::-1]
+    rng = random.Random(seed)
+    names = rng.sample(names, rng.randint(1, 8))
+    if seed % 4 == 0:
+        # landscapes merged again update the merged ones
+        names += names[:2]
+    elif seed % 4 == 1:
+        names = names[:1] * 2
+    return names
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_merge_landscape_dict_equals_scanning_merge(seed: int, monkeypatch):
+    landscape_names = _get_landscape_names(seed)
+    merged = merge_landscape_dict(_get_landscapes(landscape_names), log_level=None)
+    monkeypatch.setattr(landscape_merge, "_LandscapeIndex", _ScanningIndex)
+    assert merged == merge_landscape_dict(
+        _get_landscapes(landscape_names), log_level=None
+    )
+
+
+def _get_relation_variants(relation: dict) -> list[dict]:
+    # relations differing in ways the fingerprint must tell apart or not
+    variants = [relation, dict(reversed(relation.items()))]
+    variants.append({**relation, "label": "Label"})
+    for side in ("source", "target"):
+        if isinstance(relation.get(side), dict):
+            variants.append({**relation, side: {**relation[side], "key": 1}})
+            variants.append({**relation, side: {**relation[side], "key": 1.0}})
+            variants.append({**relation, side: {**relation[side], "key": True}})
+    return variants
+
+
+def _get_relation_string_or_error(get_string, relation: dict, scheme: str):
+    # relations with malformed mappings fail to be hashed
+    try:
+        return get_string(relation, scheme)
+    except AttributeError as e:
+        return type(e)
+
+
+@pytest.mark.parametrize("scheme", list(RELATION_HASH_SCHEMES))
+def test_cached_relation_strings_equal_uncached(scheme: str, monkeypatch):
+    # a small cache evicts the relation strings while they are hashed
+    monkeypatch.setattr(landscape_merge, "_relation_hash_cache", _RelationHashCache(16))
+    relations = [
+        variant
+        for relation in _relations
+        for variant in _get_relation_variants(relation)
+    ]
+    uncached = [
+        _get_relation_string_or_error(_get_uncached_relation_string, relation, scheme)
+        for relation in relations
+    ]
+    for _ in range(2):
+        assert [
+            _get_relation_string_or_error(get_relation_string, relation, scheme)
+            for relation in relations
+        ] == uncached
+
+    hashable_relations = [
+        relation
+        for relation, relation_string in zip(relations, uncached)
+        if not isinstance(relation_string, type)
+    ]
+    hashable_strings = [
+        relation_string
+        for relation_string in uncached
+        if not isinstance(relation_string, type)
+    ]
+    assert get_relation_strings(hashable_relations, scheme) == hashable_strings
+    assert landscape_merge.get_relation_hash_cache_info()["hits"] > 0
+
+    # relations with equal fingerprints have equal strings
+    relation_strings_by_key = {}
+    for relation, relation_string in zip(hashable_relations, hashable_strings):
+        key = _get_relation_cache_key(relation, scheme)
+        if key is not None:
+            assert relation_strings_by_key.setdefault(key, relation_string) == (
+                relation_string
+            )
@@ -1,6 +1,9 @@
-import networkx as nx
-from uuid import uuid4 as uuid
 import random
+from uuid import uuid4 as uuid
+
+import networkx as nx
+
+from landscape_graph import get_nodes_of_type
 
 
 def generate_landscape_with_real_uploaded_dataset(
@@ -8,9 +11,8 @@ def generate_landscape_with_real_uploaded_dataset(
 ) -> tuple[str, dict]:
     entities = [
         attr.get("data")
-        for n, attr in G.nodes(data=True)
-        if attr.get("data", {"type": None}).get("type") == "entity"
-        and attr.get("data", {"name": None}).get("name")
+        for n, attr in get_nodes_of_type(G, "entity")
+        if attr.get("data", {"name": None}).get("name")
         in ["Gene", "Cell Line", "ClinVar Variants"]
     ]
 
@@ -29,7 +31,8 @@ def generate_landscape_with_real_uploaded_dataset(
 
     unique_id = f"db.upload.{uuid().hex}"
     random_entity = {
-        **random_entity_configuration,
+        # the origins are set when the uploaded dataset is added to the graph
+        **{k: v for k, v in random_entity_configuration.items() if k != "origins"},
         "id": unique_id,
         "name": f"Uploaded {random_entity_configuration.get('name')}",
         "type": "entity",
@@ -61,17 +64,9 @@ def generate_landscape_with_real_uploaded_dataset(
 def generate_landscape_with_random_uploaded_dataset(
     G: nx.MultiDiGraph, payload: dict
 ) -> tuple[str, dict]:
-    entities = [
-        attr.get("data")
-        for n, attr in G.nodes(data=True)
-        if attr.get("data", {"type": None}).get("type") == "entity"
-    ]
+    entities = [attr.get("data") for n, attr in get_nodes_of_type(G, "entity")]
 
-    idtypes = [
-        n
-        for n, attr in G.nodes(data=True)
-        if attr.get("data", {"type": None}).get("type") == "idtype"
-    ]
+    idtypes = [n for n, attr in get_nodes_of_type(G, "idtype")]
 
     random_entity_name = [
         "Gene",
@@ -111,7 +106,8 @@ def generate_landscape_with_random_uploaded_dataset(
 
     unique_id = f"db.upload.{uuid().hex}"
     random_entity = {
-        **random_entity_configuration,
+        # the origins are set when the uploaded dataset is added to the graph
+        **{k: v for k, v in random_entity_configuration.items() if k != "origins"},
         "id": unique_id,
         "name": f"Uploaded {random_entity_name}",
         "type": "entity",